@@ -0,0 +1,116 @@
+""" Benchmarks of jjsim. Writes the results as JSON.
+
+    python benchmarks/bench.py [-o results.json] [-s scale]
+
+    Measures steps per second of every junction type and DiffSolver 
+    integrator and the runtime of IVPlot and hyst on a small fixed grid.
+    scale multiplies the simulated durations."""
+import os, sys, json, shutil, tempfile, platform, datetime, argparse
+from timeit import default_timer as timer
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import numpy as np
+from jjsim import JJs, DiffSolver
+from jjsim.data import IVPlot
+
+def best(fn, repeat = 3):
+    """ Returns the shortest of repeat runs of fn, in seconds."""
+    ts = []
+    for r in xrange(repeat):
+        t = timer()
+        fn()
+        ts.append(timer() - t)
+    return min(ts)
+
+def rate(name, steps, secs, **info):
+    """ Returns the result of a benchmark as a dict."""
+    out = {'name': name, 'steps': steps, 'seconds': secs, 'steps_per_sec': steps/secs}
+    out.update(info)
+    return out
+
+def arrayB(rows, columns):
+    """ Returns a banded damping matrix for a rows x columns array."""
+    N = rows*columns
+    return [[4.0 if k == l else (-1.0 if abs(k - l) in (1, columns) else 0.0) for l in xrange(N)] for k in xrange(N)]
+
+def junctions(scale):
+    """ Benchmarks applyI of every junction type."""
+    T = 200*scale
+    out = []
+    makers = [('JJ', lambda: JJs.JJ(b_c = 2.0)),
+              ('JJn', lambda: JJs.JJn(b_c = 2.0, temp = .05)),
+              ('JJFreq', lambda: JJs.JJFreq(b_c = 2.0, Q1 = .5)),
+              ('JJnFreq', lambda: JJs.JJnFreq(b_c = 2.0, Q1 = .5, temp = .05))]
+    for name, make in makers:
+        j = make()
+        out.append(rate(name, int(T/j.dt), best(lambda: j.applyI(1.2, T))))
+    js = [JJs.JJn(b_c = 2.0, temp = .05) for k in xrange(1000)]
+    e = JJs.JJEnsemble(js, seed = 0)
+    out.append(rate('JJEnsemble', int(T/e.dt)*len(e), best(lambda: e.applyI(1.2, T)), junctions = len(e)))
+    for rows, columns in ((2, 2), (5, 5), (10, 10), (30, 30)):
+        N = rows*columns
+        iex = [0.0]*N
+        iex[0], iex[-1] = 1.0, -1.0
+        a = JJs.JJArray(rows, columns, arrayB(rows, columns), iex)
+        Ta = T/10
+        out.append(rate('JJArray', int(Ta/a.dt), best(lambda: a.applyI(1.2, Ta)), rows = rows, columns = columns))
+    return out
+
+def integrators(scale):
+    """ Benchmarks the junction integrators and the DiffSolver steps."""
+    T = 200*scale
+    out = []
+    for name in ('euler', 'rk4', 'dopri'):
+        j = JJs.JJ(b_c = 2.0)
+        out.append(rate('JJ.applyI ' + name, int(T/j.dt), best(lambda: j.applyI(1.2, T, name)), sim_time = T))
+    for name in ('euler', 'heun'):
+        j = JJs.JJn(b_c = 2.0, temp = .05)
+        out.append(rate('JJn.applyI ' + name, int(T/j.dt), best(lambda: j.applyI(1.2, T, name)), sim_time = T))
+    f = lambda x, t: [x[1], -x[0]]
+    n = int(2000*scale)
+    def loop(step):
+        x = [1.0, 0.0]
+        for k in xrange(n):
+            x = step(x)
+    out.append(rate('DiffSolver.euler', n, best(lambda: loop(lambda x: DiffSolver.euler(x, f, .01)))))
+    out.append(rate('DiffSolver.RK4', n, best(lambda: loop(lambda x: DiffSolver.RK4(x, (lambda x, t: x[1], lambda x, t: -x[0]), .01)))))
+    out.append(rate('DiffSolver.euler_vec', n, best(lambda: loop(lambda x: DiffSolver.euler_vec(np.array(x), f, .01)))))
+    out.append(rate('DiffSolver.rk4_vec', n, best(lambda: loop(lambda x: DiffSolver.rk4_vec(x, f, .01)))))
+    steps = DiffSolver.dopri([1.0, 0.0], f, n*.01, .01)[2]
+    out.append(rate('DiffSolver.dopri', steps, best(lambda: DiffSolver.dopri([1.0, 0.0], f, n*.01, .01)), sim_time = n*.01))
+    return out
+
+def sweeps(scale):
+    """ Benchmarks IVPlot and hyst end to end on a fixed small grid."""
+    T = 50*scale
+    out = []
+    d = tempfile.mkdtemp()
+    try:
+        for name, fn in (('IVPlot', IVPlot.IVPlot), ('hyst', IVPlot.hyst)):
+            js = [JJs.JJ(b_c = 2.0), JJs.JJn(b_c = 2.0, temp = .05)]
+            secs = best(lambda: fn(js, T, .1, 0.0, 1.5, os.path.join(d, name + '.dat'), seed = 0, progress = lambda info: None), 1)
+            out.append({'name': name, 'seconds': secs, 'T': T, 'di': .1, 'imax': 1.5, 'junctions': len(js)})
+    finally:
+        shutil.rmtree(d)
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmarks of jjsim')
+    parser.add_argument('-o', '--out', help = 'JSON file to write (default: stdout)')
+    parser.add_argument('-s', '--scale', type = float, default = 1.0, help = 'multiplies the simulated durations')
+    args = parser.parse_args()
+    res = {'date': datetime.datetime.now().isoformat(),
+           'python': platform.python_version(),
+           'numpy': np.__version__,
+           'machine': platform.machine(),
+           'scale': args.scale,
+           'junctions': junctions(args.scale),
+           'integrators': integrators(args.scale),
+           'sweeps': sweeps(args.scale)}
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(res, f, indent = 1)
+    else:
+        print(json.dumps(res, indent = 1))
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -1,3 +1,11 @@
+import math
+import numpy as np
+try:
+    import scipy.sparse as sparse
+    from scipy.sparse.linalg import splu
+except ImportError:
+    splu = None
+
 def RK4(xs, fxs, dt, t = 0):
     """ Returns final xs tuple after time dt has passed.
 
@@ -33,7 +41,7 @@ def RK4(xs, fxs, dt, t = 0):
         x4.append(xs[i] + fx3[i])
     fx4 = []
     for fx in fxs:
-        fx3.append(dt * fx(x4, t + dt))
+        fx4.append(dt * fx(x4, t + dt))
 
     xf = []
     for i in xrange(0,l):
@@ -64,6 +72,106 @@ def euler(x0, f, dt, t = 0):
     for i in xrange(len(x0)):
         xf[i] = x0[i] + dt*dx[i]
     return xf
+
+def euler_vec(x0, f, dt, t = 0):
+    """ Euler step for a numpy array of variables. x0 is updated in place and returned.
+
+        x0: initial conditions (numpy array)
+        f: derivative function f(x, t), returning an array like x0 (must be callable)
+        dt: timestep (number)
+        t: initial time (number)"""
+    x0 += dt*np.asarray(f(x0, t))
+    return x0
+
+def rk4_vec(x0, f, dt, t = 0):
+    """ Fourth order Runge-Kutta step for an array of variables. Returns the final x as a numpy array.
+
+        x0: initial conditions (numpy array or list)
+        f: derivative function f(x, t), returning all the derivatives (must be callable)
+        dt: timestep (number)
+        t: initial time (number)"""
+    x = np.asarray(x0, dtype=float)
+    k1 = np.asarray(f(x, t))
+    k2 = np.asarray(f(x + (.5*dt)*k1, t + .5*dt))
+    k3 = np.asarray(f(x + (.5*dt)*k2, t + .5*dt))
+    k4 = np.asarray(f(x + dt*k3, t + dt))
+    return x + (dt/6.0)*(k1 + 2*k2 + 2*k3 + k4)
+
+# Dormand-Prince 5(4) tableau
+DP_C = [0.0, 1/5.0, 3/10.0, 4/5.0, 8/9.0, 1.0, 1.0]
+DP_A = [[],
+        [1/5.0],
+        [3/40.0, 9/40.0],
+        [44/45.0, -56/15.0, 32/9.0],
+        [19372/6561.0, -25360/2187.0, 64448/6561.0, -212/729.0],
+        [9017/3168.0, -355/33.0, 46732/5247.0, 49/176.0, -5103/18656.0],
+        [35/384.0, 0.0, 500/1113.0, 125/192.0, -2187/6784.0, 11/84.0]]
+# difference between the fifth and fourth order weights
+DP_E = [71/57600.0, 0.0, -71/16695.0, 71/1920.0, -17253/339200.0, 22/525.0, -1/40.0]
+
+def dopri(x0, f, T, dt, t = 0, rtol = 1e-6, atol = 1e-9):
+    """ Integrates x0 over a duration T with adaptive Dormand-Prince 5(4) steps. 
+        Returns the final x (numpy array), the suggested size of the next step 
+        and the number of steps taken.
+
+        x0: initial conditions (numpy array or list)
+        f: derivative function f(x, t), returning all the derivatives (must be callable)
+        T: duration of the integration (number)
+        dt: size of the first step tried (number)
+        t: initial time (number)
+        rtol, atol: relative and absolute error tolerated on each step"""
+    x = np.array(x0, dtype=float)
+    tf = t + T
+    h = float(dt)
+    n = 0
+    k = [np.asarray(f(x, t))] + [None]*6
+    while tf - t > 1e-12*T:
+        hs = min(h, tf - t)
+        for s in xrange(1, 7):
+            xs = x.copy()
+            for r, a in enumerate(DP_A[s]):
+                if a != 0.0:
+                    xs += (hs*a)*k[r]
+            k[s] = np.asarray(f(xs, t + DP_C[s]*hs))
+        err = np.zeros(len(x))
+        for r, e in enumerate(DP_E):
+            if e != 0.0:
+                err += (hs*e)*k[r]
+        sc = atol + rtol*np.maximum(abs(x), abs(xs))
+        e = math.sqrt(np.mean((err/sc)**2))
+        if e <= 1.0:
+            # the last stage is evaluated at the new point, so it is reused as the next first stage
+            t += hs
+            x = xs
+            k[0] = k[6]
+            n += 1
+        hn = hs*min(5.0, max(0.2, 0.9*e**-0.2)) if e > 0 else 5*hs
+        # a step cut short to end at tf says nothing against the longer step before it
+        h = max(h, hn) if e <= 1.0 and hs < h else hn
+    return x, h, n
+
+def integrate(x0, f, T, dt, method = 'rk4', t = 0, rtol = 1e-6, atol = 1e-9):
+    """ Integrates x0 over a duration T and returns the final x as a numpy array.
+
+        x0: initial conditions (numpy array or list)
+        f: derivative function f(x, t), returning all the derivatives (must be callable)
+        T: duration of the integration (number)
+        dt: timestep (number)
+        method: 'euler' or 'rk4' take fixed steps of dt, 'dopri' takes adaptive steps starting at dt
+        t: initial time (number)
+        rtol, atol: relative and absolute error tolerated on each dopri step (see dopri)"""
+    if method == 'dopri':
+        return dopri(x0, f, T, dt, t, rtol, atol)[0]
+    if method == 'euler':
+        step = euler_vec
+    elif method == 'rk4':
+        step = rk4_vec
+    else:
+        raise Exception('Unknown integrator {0}'.format(method))
+    x = np.array(x0, dtype=float)
+    for k in xrange(int(round(T/dt))):
+        x = step(x, f, dt, t + k*dt)
+    return x
     
 def dot(v1, v2):
     'dot product of two vectors.'
@@ -105,4 +213,31 @@ def gauss_jordan(m, eps = 1.0/(10**10)):
 def matInv(M):
     """ Returns the inverse of the matrix M."""
     m2 = [row[:]+[int(i==j) for j in range(len(M) )] for i,row in enumerate(M) ]
-    return [row[len(M[0]):] for row in m2] if gauss_jordan(m2) else None
\ No newline at end of file
+    return [row[len(M[0]):] for row in m2] if gauss_jordan(m2) else None
+
+def asMatrix(M, shape = None):
+    """ Returns M as a scipy sparse matrix when scipy is installed and as a dense numpy array without it.
+
+        M: square matrix (list of lists, numpy array or scipy sparse matrix), or the
+           (values, (rows, columns)) of its entries when shape is given. Repeated entries are added up
+        shape: shape of the matrix built from its entries"""
+    if splu is not None:
+        return sparse.csc_matrix(M, shape=shape, dtype=float)
+    if shape is None:
+        return np.array(M, dtype=float)
+    vals, (rows, cols) = M
+    out = np.zeros(shape)
+    np.add.at(out, (rows, cols), vals)
+    return out
+
+def factorize(M):
+    """ Returns a function that solves M x = b for x. M is factorized once here, 
+        so every later solve is only a pair of triangular solves.
+
+        M: square matrix (list of lists, numpy array or scipy sparse matrix)
+
+        M is kept sparse and LU factorized when scipy is installed. 
+        Without scipy it is inverted densely with numpy."""
+    if splu is not None:
+        return splu(sparse.csc_matrix(M, dtype=float)).solve
+    return np.linalg.inv(np.array(M, dtype=float)).dot
\ No newline at end of file
@@ -1,5 +1,19 @@
-import math, random
-from DiffSolver import euler, matmult, matInv
+import math, time
+import numpy as np
+from DiffSolver import euler_vec, integrate, dopri, factorize, asMatrix
+from Stats import RunningStats
+
+NOISE_BLOCK = 4096 # number of normal random numbers drawn at once by noisy junctions
+
+def integrateJunction(j, x, f, T, integrator):
+    """ Integrates the state x of junction j over a duration T with a DiffSolver integrator
+        and returns the final state. The dopri integrator tolerates the errors j.rtol and
+        j.atol on each step, and starts from the step size j.h it ended the last call with,
+        which it leaves there for the next call."""
+    if integrator == 'dopri':
+        x, j.h, steps = dopri(x, f, T, j.h or j.dt, 0, j.rtol, j.atol)
+        return x
+    return integrate(x, f, T, j.dt, integrator)
 
 class JJ:
     """ A Josephson Junction"""
@@ -16,6 +30,13 @@ class JJ:
         # b>1 is underdmaped. b<1 is overdamped
         self.dt = float(dt)
         self.i = 0
+        self.integrator = 'euler'
+        self.tol = None
+        self.rtol = 1e-6 # errors tolerated on each step of the dopri integrator
+        self.atol = 1e-9
+        self.h = None # step size the dopri integrator goes on with
+        self.steps = 0
+        self.timers = None # Stats.Timers of the integrator, derivative and noise, if they are counted
 
     def getInfo(self):
         """ Returns info about junction."""
@@ -26,31 +47,173 @@ class JJ:
         """ Returns type of junction."""
         return 'simple'
 
-    def applyI(self, i = 0.0, T=1000):
+    def applyI(self, i = 0.0, T=1000, integrator=None, tol=None, settle=None, spectrum=None, rtol=None, atol=None):
         """ Applies bias current to the junction for duration T.
 
             i: applied bias current
             dt: timestep for numerics
             T: duration of counting
+            integrator: 'euler', 'verlet', 'rk4' or 'dopri' (defaults to self.integrator)
+            rtol, atol: relative and absolute error tolerated on each dopri step. 
+                        They are kept in self.rtol and self.atol, like the current in self.i
+            tol: if given (or set in self.tol), stops as soon as the average 
+                 voltage is known to within tol (see converge)
+            settle: fraction of T run before the averaging starts, for a junction 
+                    started close to its final state (None is three fifths). 
+                    Ignored with tol, which finds the end of the transient itself
+            spectrum: data.Spectrum.Spectrum fed with the voltage while it is averaged
 
             sets the phase to the most recent phase
             sets voltage to average over last three fifths 
             of T returns the average voltage."""
         self.i = i
+        if rtol is not None:
+            self.rtol = rtol
+        if atol is not None:
+            self.atol = atol
+        integrator = integrator or self.integrator
+        tol = tol if tol is not None else self.tol
+        start = time.time()
+        if tol is not None:
+            v = self.converge(T, tol, integrator, spectrum)
+        else:
+            iT = int(T/self.dt) # renormalized time to integer values
+            t0 = 3*iT/5 + 1 # steps before the averaging starts
+            n = iT - t0
+            if settle is not None:
+                t0 = int(settle*iT)
+            self.advance(t0, integrator)
+            if spectrum is None:
+                v = self.advance(n, integrator)/n
+            else:
+                spectrum.cut()
+                v = spectrum.run(self, n, integrator)/n
+            self.steps = t0 + n
+            self.setP(self.phase)
+        if self.timers is not None:
+            self.timers.add('integrator', time.time() - start)
+        return v
+
+    def converge(self, T, tol, integrator = 'euler', spectrum = None):
+        """ Runs the junction at the present bias current until its average voltage 
+            is known to within tol, or for at most duration T. 
+
+            The run is split into batches of T/50. The first batch is dropped and 
+            running statistics of the batch means of v and of the phase slip rate
+            are kept. They are restarted when a batch falls far outside of them, 
+            since the junction was then still settling. The run stops once the
+            standard error of the mean voltage is below tol.
+
+            sets self.steps to the number of steps used, self.converged, 
+            self.vstats and self.slips to the running statistics of the 
+            voltage and phase slip rate (slips per unit time) and 
+            returns the average voltage. A spectrum (see applyI) is fed the batches 
+            after the first one and restarted along with the statistics."""
         iT = int(T/self.dt) # renormalized time to integer values
+        m = max(iT/50, 1)
+        self.vstats = RunningStats()
+        self.slips = RunningStats()
+        self.converged = False
+        steps = 0
+        while steps + m <= iT and not self.converged:
+            p0 = self.phase
+            if spectrum is None or steps == 0:
+                vb = self.advance(m, integrator)/m
+            else:
+                if steps == m:
+                    spectrum.cut() # the first batch was not fed
+                vb = spectrum.run(self, m, integrator)/m
+            sb = (self.phase - p0)/(2*math.pi*m*self.dt)
+            steps += m
+            if steps == m:
+                continue
+            if self.vstats.n > 1 and abs(vb - self.vstats.mean) > 3*self.vstats.std() + tol:
+                self.vstats.reset()
+                self.slips.reset()
+                if spectrum is not None:
+                    spectrum.reset()
+            self.vstats.add(vb)
+            self.slips.add(sb)
+            self.converged = self.vstats.n >= 4 and self.vstats.stderr() < tol
+        self.steps = steps
+        self.setP(self.phase)
+        return self.vstats.mean
+
+    def advance(self, n, integrator = 'euler'):
+        """ Advances the junction n timesteps at the present bias current,
+            without taking the phase mod 2*pi.
+
+            n: number of timesteps
+            integrator: 'euler', 'verlet' (see verlet), 'rk4' or 'dopri'
+
+            returns the sum of the voltage over the steps. The rk4 and dopri 
+            integrators return the phase slip over dt instead, which is the same 
+            sum for small dt."""
+        if integrator == 'verlet':
+            return self.verlet(n)
+        if integrator != 'euler':
+            return self.integrateSteps(n, integrator)
+        # the euler step of dx, fused into one loop over local variables
+        i = self.i
+        dt = self.dt
+        b_ = self.b
+        sin = math.sin
+        p = self.phase
+        v = self.volt
+        sumv = 0.0
+        for t in xrange(n):
+            a = (i - v - sin(p))/b_
+            p += dt*v
+            v += dt*a
+            sumv += v
+        self.phase, self.volt = p, v
+        return sumv
+
+    def verlet(self, n):
+        """ Advances the junction n timesteps with velocity Verlet, with the damping 
+            taken by the trapezoidal rule. A half kick from the present phase, a drift 
+            of the phase and a half kick from the new phase, in which the damping of 
+            the new voltage is implicit. 
+
+            The scheme is second order and neither gains nor loses energy 
+            without damping, so underdamped junctions (b_c >> 1) can take much 
+            larger timesteps than with euler.
+
+            returns the sum of the voltage over the steps."""
+        i = self.i
+        dt = self.dt
+        c = .5*dt/self.b
+        r = 1/(1 + c)
+        sin = math.sin
         p = self.phase
         v = self.volt
         sumv = 0.0
-        vtot = 0
-        for t in xrange(iT):
-            pv = euler([p, v], self.dx, self.dt)
-            p, v = pv
-            if t > 3*iT/5:
-                sumv+=v
-                vtot+=1
-        self.setP(p)
-        self.volt = v
-        return sumv/vtot
+        for t in xrange(n):
+            v += c*(i - v - sin(p))
+            p += dt*v
+            v = (v + c*(i - sin(p)))*r
+            sumv += v
+        self.phase, self.volt = p, v
+        return sumv
+
+    def integrateSteps(self, n, integrator):
+        """ Advances the junction n timesteps with a DiffSolver integrator.
+            Returns the phase slip over dt."""
+        if self.getTemp() != 0:
+            raise Exception('Noisy junctions can only use the euler or heun integrator')
+        p0 = self.phase
+        f = self.dx if self.timers is None else self.timers.wrap('derivative', self.dx)
+        x = integrateJunction(self, self.getState(), f, n*self.dt, integrator)
+        self.setState(x)
+        return (x[0] - p0)/self.dt
+
+    def getState(self):
+        """ Returns the list of the variables of the diff eq."""
+        return [self.phase, self.volt]
+
+    def setState(self, x):
+        """ Sets the variables of the diff eq from the list x."""
+        self.phase, self.volt = float(x[0]), float(x[1])
 
     def dx(self, x, t):
         """ Returns derivative for diff eq."""
@@ -72,9 +235,8 @@ class JJ:
     def getPhaseVolt(self, i = 0.0):
         """ Applies current and returns phase and voltage at point."""
         self.i = i
-        pv = euler([self.phase, self.volt], self.dx, self.dt)
-        self.phase, self.volt = pv
-        return pv
+        self.advance(1, self.integrator)
+        return [self.phase, self.volt]
 
 class JJn(JJ):
     """A Josephson Junction with thermal noise"""
@@ -89,6 +251,7 @@ class JJn(JJ):
 
         JJ.__init__(self, b_c, p, v, dt)
         self.setTemp(temp)
+        self.seed()
 
     def getInfo(self):
         """ Returns info about junction."""
@@ -103,11 +266,52 @@ class JJn(JJ):
         """ Returns derivative for diff eq."""
         i_ = self.i
         b_ = self.b
-        i_n = random.gauss(0, self.sig)
+        i_n = self.sig*self.gauss()
         dp = x[1]
         dv = (i_ + i_n - x[1] - math.sin(x[0]))/b_
         return [dp, dv]
 
+    def advance(self, n, integrator = 'euler'):
+        """ Advances the junction n timesteps at the present bias current,
+            without taking the phase mod 2*pi.
+
+            n: number of timesteps
+            integrator: 'euler' (Euler-Maruyama) or 'heun' (stochastic Heun)
+
+            returns the sum of the voltage over the steps."""
+        if integrator not in ('euler', 'heun'):
+            raise Exception('Noisy junctions can only use the euler or heun integrator')
+        heun = integrator == 'heun'
+        i = self.i
+        dt = self.dt
+        h = .5*dt
+        b_ = self.b
+        w = self.sig*dt/b_ # size of the noise kick on v
+        sin = math.sin
+        p = self.phase
+        v = self.volt
+        buf, k = self.nbuf, self.nk
+        sumv = 0.0
+        for t in xrange(n):
+            if k == len(buf):
+                buf, k = self.noise(NOISE_BLOCK), 0
+            eta = w*buf[k]
+            k += 1
+            a = (i - v - sin(p))/b_
+            if heun:
+                # the predictor and corrector share the same noise kick
+                p1 = p + dt*v
+                v1 = v + dt*a + eta
+                p += h*(v + v1)
+                v += h*(a + (i - v1 - sin(p1))/b_) + eta
+            else:
+                p += dt*v
+                v += dt*a + eta
+            sumv += v
+        self.nbuf, self.nk = buf, k
+        self.phase, self.volt = p, v
+        return sumv
+
     def getTemp(self):
         """ Returns normalized temperature at which the junction is operating."""
         return self.sig*self.sig*.5*self.dt
@@ -116,6 +320,32 @@ class JJn(JJ):
         """ Sets self.sig to the appropriate value for the temperature."""
         self.sig = math.sqrt((temp + temp)/self.dt)
 
+    def seed(self, s = None):
+        """ Gives the junction its own random stream for the noise, seeded with s 
+            (None seeds randomly). Empties the noise buffer."""
+        self.rng = np.random.RandomState(s)
+        self.seeded = s is not None
+        self.nbuf = []
+        self.nk = 0
+
+    def noise(self, n):
+        """ Returns a list of n standard normal numbers drawn from self.rng."""
+        if self.timers is None:
+            return self.rng.standard_normal(n).tolist()
+        start = time.time()
+        out = self.rng.standard_normal(n).tolist()
+        self.timers.add('noise', time.time() - start)
+        return out
+
+    def gauss(self):
+        """ Returns the next standard normal number of the noise. 
+            They are drawn from self.rng in blocks of NOISE_BLOCK."""
+        if self.nk == len(self.nbuf):
+            self.nbuf = self.noise(NOISE_BLOCK)
+            self.nk = 0
+        self.nk += 1
+        return self.nbuf[self.nk - 1]
+
 class JJFreq(JJ):
     """ A Josephson Junction with frequency dependent circuit elements."""
     def __init__(self, b_c = 1.0, p = 0.0, v = 0.0, vc = 0.0, Q1 = 1.0, rho = 1.0, dt = .01):
@@ -158,42 +388,82 @@ class JJFreq(JJ):
         d_ = self.d
         e_ = self.e
         dp = x[1]
-        dv = (i_ + i_n - x[1] - math.sin(x[0]))/b_
-        dvc = e_*(v - vc)
+        dv = (i_ - x[1] - math.sin(x[0]) - d_*(x[1]-x[2]))/b_
+        dvc = e_*(x[1] - x[2])
         return [dp, dv, dvc]
     
-    def applyI(self, i = 0.0, T=1000):
-        """ Applies bias current to the junction for duration T.
-
-            i: applied bias current
-            T: duration of counting
-
-            sets the phase to the most recent phase
-            sets voltage to average over last three fifths 
-            of T returns the average voltage."""
-        self.i = i
-        iT = int(T/self.dt) # renormalized time to integer values
+    def getState(self):
+        """ Returns the list of the variables of the diff eq."""
+        return [self.phase, self.volt, self.v_c]
+
+    def setState(self, x):
+        """ Sets the variables of the diff eq from the list x."""
+        self.phase, self.volt, self.v_c = float(x[0]), float(x[1]), float(x[2])
+
+    def advance(self, n, integrator = 'euler'):
+        """ Advances the junction n timesteps at the present bias current,
+            without taking the phase mod 2*pi.
+
+            n: number of timesteps
+            integrator: 'euler', 'verlet', 'rk4' or 'dopri'
+
+            returns the sum of the voltage over the steps (see JJ.advance)."""
+        if integrator == 'verlet':
+            return self.verlet(n)
+        if integrator != 'euler':
+            return self.integrateSteps(n, integrator)
+        # the euler step of dx, fused into one loop over local variables
+        i = self.i
+        dt = self.dt
+        b_ = self.b
+        d_ = self.d
+        e_ = self.e
+        sin = math.sin
         p = self.phase
         v = self.volt
         vc = self.v_c
         sumv = 0.0
-        vtot = 0
-        for t in xrange(iT):
-            pvv = euler([p, v, vc], self.dx, self.dt)
-            p, v, vc = pvv
-            if t > 3*iT/5:
-                sumv+=v
-                vtot+=1
-        self.setP(p)
-        self.volt, self.v_c = v, vc
-        return sumv/vtot
-
-    def getPhaseVolt(self, i = 0.0):
-        """ Applies current and returns phase and voltage at point."""
-        self.i = i
-        pvv = euler([self.phase, self.volt, self.v_c], self.dx, self.dt)
-        self.phase, self.volt, self.v_c = pvv
-        return pvv[:2]
+        for t in xrange(n):
+            a = (i - v - sin(p) - d_*(v - vc))/b_
+            ac = e_*(v - vc)
+            p += dt*v
+            v += dt*a
+            vc += dt*ac
+            sumv += v
+        self.phase, self.volt, self.v_c = p, v, vc
+        return sumv
+
+    def verlet(self, n):
+        """ Advances the junction n timesteps with velocity Verlet (see JJ.verlet).
+            The voltages v and vc are damped together, so the implicit half kick 
+            solves the 2x2 system of their damping.
+
+            returns the sum of the voltage over the steps."""
+        i = self.i
+        dt = self.dt
+        b_ = self.b
+        d_ = self.d
+        e_ = self.e
+        c = .5*dt
+        # (1 - c*A) of the damping A of (v, vc), inverted
+        m00, m01, m10, m11 = 1 + c*(1 + d_)/b_, -c*d_/b_, -c*e_, 1 + c*e_
+        det = m00*m11 - m01*m10
+        m00, m01, m10, m11 = m11/det, -m01/det, -m10/det, m00/det
+        sin = math.sin
+        p = self.phase
+        v = self.volt
+        vc = self.v_c
+        sumv = 0.0
+        for t in xrange(n):
+            dv = c*(i - v - sin(p) - d_*(v - vc))/b_
+            vc += c*e_*(v - vc)
+            v += dv
+            p += dt*v
+            v += c*(i - sin(p))/b_
+            v, vc = m00*v + m01*vc, m10*v + m11*vc
+            sumv += v
+        self.phase, self.volt, self.v_c = p, v, vc
+        return sumv
 
 class JJnFreq(JJFreq, JJn):
     """ A noisy Josephson Junction with frequency dependent circuit elements."""
@@ -211,6 +481,7 @@ class JJnFreq(JJFreq, JJn):
 
         JJFreq.__init__(self, b_c, p, v, vc, Q1, rho, dt)
         self.setTemp(temp)
+        self.seed()
 
     def getInfo(self, dt = .01):
         """ Returns info about junction."""
@@ -231,108 +502,402 @@ class JJnFreq(JJFreq, JJn):
         b_ = self.b
         d_ = self.d
         e_ = self.e
-        i_n = random.gauss(0, self.sig)
-        i_n1 = random.gauss(0, self.sig * math.sqrt(d_))
+        i_n = self.sig*self.gauss()
+        i_n1 = self.sig * math.sqrt(d_)*self.gauss()
         dp = x[1]
         dv = (i_ + i_n + i_n1 - x[1] - math.sin(x[0]) - d_*(x[1]-x[2]))/b_
         dvc = e_*(x[1] - x[2] - i_n1/d_)
         return [dp, dv, dvc]
 
+    def advance(self, n, integrator = 'euler'):
+        """ Advances the junction n timesteps at the present bias current,
+            without taking the phase mod 2*pi.
+
+            n: number of timesteps
+            integrator: 'euler' (Euler-Maruyama) or 'heun' (stochastic Heun)
+
+            returns the sum of the voltage over the steps."""
+        if integrator not in ('euler', 'heun'):
+            raise Exception('Noisy junctions can only use the euler or heun integrator')
+        heun = integrator == 'heun'
+        i = self.i
+        dt = self.dt
+        h = .5*dt
+        b_ = self.b
+        d_ = self.d
+        e_ = self.e
+        w = self.sig*dt/b_ # size of the noise kicks on v
+        w1 = w*math.sqrt(d_)
+        wc = -self.sig*dt*e_/math.sqrt(d_) # size of the noise kick on vc
+        sin = math.sin
+        p = self.phase
+        v = self.volt
+        vc = self.v_c
+        buf, k = self.nbuf, self.nk
+        sumv = 0.0
+        for t in xrange(n):
+            if k + 2 > len(buf):
+                buf, k = buf[k:] + self.noise(NOISE_BLOCK), 0
+            eta = w*buf[k] + w1*buf[k+1]
+            etac = wc*buf[k+1]
+            k += 2
+            a = (i - v - sin(p) - d_*(v - vc))/b_
+            ac = e_*(v - vc)
+            if heun:
+                # the predictor and corrector share the same noise kicks
+                p1 = p + dt*v
+                v1 = v + dt*a + eta
+                vc1 = vc + dt*ac + etac
+                p += h*(v + v1)
+                v += h*(a + (i - v1 - sin(p1) - d_*(v1 - vc1))/b_) + eta
+                vc += h*(ac + e_*(v1 - vc1)) + etac
+            else:
+                p += dt*v
+                v += dt*a + eta
+                vc += dt*ac + etac
+            sumv += v
+        self.nbuf, self.nk = buf, k
+        self.phase, self.volt, self.v_c = p, v, vc
+        return sumv
+
 class JJArray():
     """ A Josephson Junction Array"""
-    def __init__(self, rows = 1, columns = 1, B_ = [[1.0]], iex = [0.0], dt = .01):
+    def __init__(self, rows = 1, columns = 1, B_ = [[1.0]], iex = [0.0], dt = .01, temp = 0.0):
         """ Initiates the junction array.
 
             rows: number of rows of grains in the array
             columns : number of columns of grains in the array
-            B_: damping matrix. It must be a square matrix of floats
+            B_: damping matrix. It must be a square matrix of floats, either dense or scipy sparse
             iex: external current multiplier. Multiplies external current on the grain by this (0.0 means no external current). All the positive components should add to 1 and the negatives to -1
-            dt: timestep """
+            dt: timestep 
+            temp: unit-less temperature of the junctions between the grains """
+        self.rows = rows
         self.cols = columns
         self.nodes = columns*rows
-        self.pv = [0.0]*(self.nodes*2)
+        self.pv = np.zeros(self.nodes*2)
         self.B = B_
-        self.Bi = matInv(B_)
-        self.Iex = iex
+        self.solve = factorize(B_)
+        self.Iex = np.array(iex, dtype=float)
         self.dt = float(dt)
         self.i = 0
+        self.integrator = 'euler'
+        self.rtol = 1e-6 # errors tolerated on each step of the dopri integrator
+        self.atol = 1e-9
+        self.h = None # step size the dopri integrator goes on with
+        self.steps = 0
+        self.timers = None # Stats.Timers of the integrator, derivative and noise, if they are counted
+        self.setEdges()
+        self.setTemp(temp)
+        self.seed()
+
+    def __getstate__(self):
+        """ Returns the attributes to pickle, without the factorizations of the damping,
+            which can not be pickled."""
+        state = self.__dict__.copy()
+        state.pop('solve', None)
+        state.pop('implicit', None)
+        return state
+
+    def __setstate__(self, state):
+        """ Restores the pickled attributes and factorizes the damping matrix again."""
+        self.__dict__.update(state)
+        self.solve = factorize(self.B)
+
+    def setEdges(self):
+        """ Builds the list of edges (junctions) between neighbouring grains.
+            Edge k goes from grain ea[k] to grain eb[k]."""
+        N = self.nodes
+        c = self.cols
+        g = np.arange(N)
+        down = g[g+c < N]
+        right = g[(g+1)%c != 0]
+        self.ea = np.concatenate((down, right))
+        self.eb = np.concatenate((down + c, right + 1))
 
     def getInfo(self):
         """ Returns info about junction array."""
-        out = 'B = {0}, Iex = {1}'.format(self.B, self.Iex)
+        out = 'B = {0}, Iex = {1}, temp = {2:n}'.format(self.B, self.Iex.tolist(), self.getTemp())
         return out
 
     def getType(self):
         """ Returns type of junction array."""
         return 'array'
 
-    def applyI(self, i = 0.0, T=1000):
+    def applyI(self, i = 0.0, T=1000, integrator=None, settle=None, spectrum=None, rtol=None, atol=None):
         """ Applies bias current to the junction array for duration T.
 
             i: applied bias current
             dt: timestep for numerics
             T: duration of counting
+            integrator: 'euler', 'verlet' (see verlet), 'rk4' or 'dopri' (defaults to self.integrator)
+            rtol, atol: relative and absolute error tolerated on each dopri step (see JJ.applyI)
+            settle: fraction of T run before the averaging starts (None is three fifths, see JJ.applyI)
+            spectrum: data.Spectrum.Spectrum fed with the voltage between the first and last node
+                      while it is averaged. Needs the euler integrator
 
             sets the phase to the most recent phase 
             T returns the average voltage between the first 
             and last node."""
         self.i = i
-        iT = int(T/self.dt) # renormalized time to integer values
+        if rtol is not None:
+            self.rtol = rtol
+        if atol is not None:
+            self.atol = atol
+        integrator = integrator or self.integrator
+        start = time.time()
+        f = self.dx if self.timers is None else self.timers.wrap('derivative', self.dx)
         pv = self.pv
-        sumv = 0.0
-        vtot = 0
-        for t in xrange(iT):
-            # print(t)
-            # print(pv[0] - pv[1])
-            # print(pv[2] - pv[3])
-            pv = euler(pv, self.dx, self.dt)
-            if t > 3*iT/5:
-                sumv += pv[self.nodes] - pv[self.nodes*2 - 1] # get voltage between first node and last node
-                # print('{0},   {1}'.format(pv[self.nodes], pv[-1]))
-                vtot += 1
-        # print(pv)
-        for i in xrange(self.nodes):
-            pv[i] = math.fmod(pv[i], 2*math.pi)
+        noisy = self.sig != 0 and len(self.ea) > 0 # a single grain has no junctions to be noisy
+        if integrator != 'euler' and noisy:
+            raise Exception('Noisy junction arrays can only use the euler integrator')
+        if integrator != 'euler' and spectrum is not None:
+            raise Exception('Spectra of junction arrays need the euler integrator')
+        iT = int(T/self.dt) # renormalized time to integer values
+        t0 = 3*iT/5 + 1 # steps before the averaging starts
+        n = iT - t0
+        if settle is not None:
+            t0 = int(settle*iT)
+        if integrator == 'verlet':
+            avg = self.verlet(t0 + n, n)/n
+            pv = self.pv
+        elif integrator != 'euler':
+            pv = integrateJunction(self, pv, f, .6*T if settle is None else settle*T, integrator)
+            p0 = pv[0] - pv[self.nodes - 1]
+            pv = integrateJunction(self, pv, f, .4*T, integrator)
+            avg = (pv[0] - pv[self.nodes - 1] - p0)/(.4*T) # phase slip between first node and last node
+        else:
+            N = self.nodes
+            sumv = 0.0
+            if spectrum is not None:
+                spectrum.cut()
+            for t in xrange(t0 + n):
+                if noisy:
+                    self.noise()
+                pv = euler_vec(pv, f, self.dt)
+                if t >= t0:
+                    sumv += pv[N] - pv[N*2 - 1] # get voltage between first node and last node
+                    if spectrum is not None:
+                        spectrum.add(pv[N] - pv[N*2 - 1], pv[0] - pv[N - 1])
+            avg = sumv/n
+        np.fmod(pv[:self.nodes], 2*math.pi, out=pv[:self.nodes])
         self.pv = pv
-        return sumv/vtot
+        self.steps = t0 + n
+        if self.timers is not None:
+            self.timers.add('integrator', time.time() - start)
+        return float(avg)
 
     def dx(self, x, t):
         """ Returns derivative for diff eq."""
-        i_ = self.i
         N = self.nodes
-        c = self.cols
-        # print('c = {0}'.format(c))
-
-        sm = [[0 for i in xrange(N)] for j in xrange(N)]
-        # print('sm = {0}'.format(sm))
-        for g in xrange(N):
-            # print(sm[0][0])
-            if g+c<N:
-                sm[g][g+c] = x[N+g]-x[N+g+c] + math.sin(x[g]-x[g+c]) #+ random.gauss(0, sig)
-                # print('1st if: {0}'.format(sm[0][0]))
-                sm[g+c][g] = -1*sm[g][g+c]
-                # print('1st if: {0}'.format(sm[0][0]))
-            if (g+1)%c != 0:
-                sm[g][g+1] = x[N+g]-x[N+g+1] + math.sin(x[g]-x[g+1]) #+ random.gauss(0, sig)
-                sm[g+1][g] = -1*sm[g][g+1]
-            # print(sm[0][0])
-
-        # print('sm = {0}'.format(sm))
-        s = [0]*N
-        for k in xrange(N):
-            s[k] = self.Iex[k]*i_ - sum(sm[k]) 
-
-        # print('s = {0}'.format(s))
-        dv = matmult(self.Bi, s)
-
-        # print('dv = {0}'.format(dv))
-        dx_ = [0.0]*(N*2)
-        for k in xrange(N):
-            dx_[k] = x[N+k]
-            dx_[k+N] = dv[k]
-
-        return dx_
+        v = x[N:]
+        dv = self.solve(self.source(x[:N], v))
+        return np.concatenate((v, dv))
+
+    def source(self, p, v = None):
+        """ Returns the current flowing into every grain, from the external current 
+            and the junctions. The current through every edge is gathered from the 
+            grains at its ends and scattered back onto them. 
+
+            p: phases of the grains
+            v: voltages of the grains (None leaves out the normal currents)"""
+        N = self.nodes
+        a = self.ea
+        b = self.eb
+        ie = np.sin(p[a] - p[b])
+        if v is not None:
+            ie = v[a] - v[b] + ie
+        if self.sig:
+            ie += self.inoise
+        return self.Iex*self.i - np.bincount(a, ie, N) + np.bincount(b, ie, N)
+
+    def verlet(self, n, m):
+        """ Advances the array n timesteps with velocity Verlet, with the damping 
+            taken by the trapezoidal rule (see JJ.verlet). The implicit half kick 
+            solves (B + dt/2*L) v = B v' + dt/2*s, where L carries the normal 
+            currents between the grains. It is factorized once for every timestep.
+
+            n: number of timesteps
+            m: number of final timesteps to sum the voltage over
+
+            returns the sum of the voltage between the first and last node over the last m steps."""
+        N = self.nodes
+        dt = self.dt
+        c = .5*dt
+        if getattr(self, 'implicit', (None,))[0] != dt:
+            a, b = self.ea, self.eb
+            L = asMatrix((np.concatenate((np.ones(2*len(a)), -np.ones(2*len(a)))), 
+                          (np.concatenate((a, b, a, b)), np.concatenate((a, b, b, a)))), (N, N))
+            B = asMatrix(self.B)
+            self.implicit = (dt, B, factorize(B + c*L))
+        dt, B, solve = self.implicit
+        src = self.source if self.timers is None else self.timers.wrap('derivative', self.source)
+        p = self.pv[:N]
+        v = self.pv[N:]
+        sumv = 0.0
+        for t in xrange(n):
+            v += c*self.solve(src(p, v))
+            p += dt*v
+            v[:] = solve(B.dot(v) + c*src(p))
+            if t >= n - m:
+                sumv += v[0] - v[N - 1]
+        return sumv
+
+    def getState(self):
+        """ Returns the array of the phases and voltages of the grains."""
+        return self.pv.copy()
+
+    def setState(self, x):
+        """ Sets the phases and voltages of the grains from x."""
+        self.pv = np.array(x, dtype=float)
 
     def getTemp(self):
         """ Returns normalized temperature at which the junction array is operating."""
-        return 0
\ No newline at end of file
+        return self.sig*self.sig*.5*self.dt
+
+    def setTemp(self, temp):
+        """ Sets self.sig to the appropriate value for the temperature. 
+            Empties the noise buffer, which was drawn for the old temperature."""
+        self.sig = math.sqrt((temp + temp)/self.dt)
+        self.nbuf = np.empty((0, len(self.ea)))
+        self.nk = 0
+        self.inoise = np.zeros(len(self.ea))
+
+    def seed(self, s = None):
+        """ Gives the array its own random stream for the noise, seeded with s 
+            (None seeds randomly). Empties the noise buffer."""
+        self.rng = np.random.RandomState(s)
+        self.seeded = s is not None
+        self.nbuf = np.empty((0, len(self.ea)))
+        self.nk = 0
+
+    def noise(self):
+        """ Sets self.inoise to the noise currents through the edges for the next timestep. 
+            They are drawn from self.rng a block of timesteps at a time, about NOISE_BLOCK numbers."""
+        if self.nk == len(self.nbuf):
+            start = time.time()
+            E = len(self.ea)
+            self.nbuf = self.sig*self.rng.standard_normal((max(NOISE_BLOCK//E, 1), E))
+            self.nk = 0
+            if self.timers is not None:
+                self.timers.add('noise', time.time() - start)
+        self.inoise = self.nbuf[self.nk]
+        self.nk += 1
+
+class JJEnsemble:
+    """ An ensemble of simple or noisy Josephson Junctions that are stepped together.
+
+        The state of the ensemble is held as numpy arrays so that every 
+        junction is advanced in a single batched step."""
+    def __init__(self, js, reps = 1, seed = None):
+        """ Initiates the ensemble from a list of junctions.
+
+            js: list of JJ or JJn junctions. They must all have the same timestep
+            reps: number of copies of js held by the ensemble
+            seed: seed for the noise of the ensemble (None seeds randomly) """
+        for j in js:
+            if j.getType() not in ('simple', 'noisy'):
+                raise Exception('Ensemble only supports simple and noisy junctions')
+            if j.dt != js[0].dt:
+                raise Exception('Junctions need the same timestep')
+        self.js = list(js)
+        self.dt = float(js[0].dt)
+        self.phase = np.tile(np.array([j.phase for j in js], dtype=float), reps)
+        self.volt = np.tile(np.array([j.volt for j in js], dtype=float), reps)
+        self.b = np.tile(np.array([j.b for j in js], dtype=float), reps)
+        self.sig = np.tile(np.array([getattr(j, 'sig', 0.0) for j in js], dtype=float), reps)
+        self.i = np.zeros(len(self.phase))
+        self.steps = 0
+        self.timers = None # Stats.Timers of the integrator and noise, if they are counted
+        self.seed(seed)
+
+    def seed(self, s = None):
+        """ Reseeds the noise of the ensemble with s (None seeds randomly)."""
+        self.rng = np.random.RandomState(s)
+
+    def noise(self, n):
+        """ Returns an array of n standard normal numbers drawn from self.rng."""
+        if self.timers is None:
+            return self.rng.standard_normal(n)
+        start = time.time()
+        out = self.rng.standard_normal(n)
+        self.timers.add('noise', time.time() - start)
+        return out
+
+    def __len__(self):
+        return len(self.phase)
+
+    def __getitem__(self, k):
+        """ Returns the junction that the k-th member of the ensemble was built from."""
+        return self.js[k % len(self.js)]
+
+    def getInfo(self):
+        """ Returns info about the first junction of the ensemble."""
+        return self.js[0].getInfo()
+
+    def getType(self):
+        """ Returns type of the first junction of the ensemble."""
+        return self.js[0].getType()
+
+    def applyI(self, i = 0.0, T = 1000, settle = None):
+        """ Applies bias current to the ensemble for duration T.
+
+            i: applied bias current. Either a number or an array with a current for each junction
+            T: duration of counting
+            settle: fraction of T run before the averaging starts (None is three fifths, see JJ.applyI)
+
+            sets the phases to the most recent phases
+            returns an array with the average voltage of each junction
+            over the last two fifths of T."""
+        self.i[:] = i
+        iT = int(T/self.dt) # renormalized time to integer values
+        t0 = 3*iT/5 + 1 # steps before the averaging starts
+        n = iT - t0
+        if settle is not None:
+            t0 = int(settle*iT)
+        dt = self.dt
+        p, v = self.phase, self.volt
+        N = len(p)
+        ib = self.i/self.b
+        rb = dt/self.b
+        sb = self.sig*rb
+        noisy = bool(self.sig.any())
+        a = np.empty(N)
+        sumv = np.zeros(N)
+        start = time.time()
+        for t in xrange(t0 + n):
+            # a = dt*dv, computed before p is moved so the step is the same as euler
+            np.sin(p, out=a)
+            a += v
+            a *= -rb
+            a += dt*ib
+            if noisy:
+                a += sb*self.noise(N)
+            p += dt*v
+            v += a
+            if t >= t0:
+                sumv += v
+        np.fmod(p, 2*math.pi, out=p)
+        self.sync()
+        self.steps = (t0 + n)*N
+        if self.timers is not None:
+            self.timers.add('integrator', time.time() - start)
+        return sumv/n
+
+    def getPhaseVolt(self, i = 0.0):
+        """ Applies current for one timestep and returns arrays of the phases and voltages."""
+        self.i[:] = i
+        a = (self.i - self.volt - np.sin(self.phase))/self.b
+        if self.sig.any():
+            a += self.sig*self.noise(len(self))/self.b
+        self.phase += self.dt*self.volt
+        self.volt += self.dt*a
+        return self.phase, self.volt
+
+    def sync(self):
+        """ Copies the state of the last copy of the ensemble back into the junctions it was built from."""
+        n = len(self.js)
+        N = len(self)
+        for k, j in enumerate(self.js):
+            j.phase = float(self.phase[N - n + k])
+            j.volt = float(self.volt[N - n + k])
+            j.i = float(self.i[N - n + k])
\ No newline at end of file
@@ -0,0 +1,129 @@
+import math, time
+import numpy as np
+
+class RunningStats:
+    """ Running mean and variance of a stream of numbers (Welford's method)."""
+    def __init__(self):
+        """ Initiates empty statistics."""
+        self.reset()
+
+    def reset(self):
+        """ Forgets every number added so far."""
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        """ Adds the number x to the statistics."""
+        self.n += 1
+        d = x - self.mean
+        self.mean += d/self.n
+        self.m2 += d*(x - self.mean)
+
+    def var(self):
+        """ Returns the sample variance (0 for less than two numbers)."""
+        if self.n < 2:
+            return 0.0
+        return self.m2/(self.n - 1)
+
+    def std(self):
+        """ Returns the sample standard deviation."""
+        return math.sqrt(self.var())
+
+    def stderr(self):
+        """ Returns the standard error of the mean."""
+        if self.n == 0:
+            return float('inf')
+        return math.sqrt(self.var()/self.n)
+
+class Welch:
+    """ Running Welch estimate of the power spectral density of a stream of samples.
+
+        The stream is cut into segments of nfft samples that overlap by the given 
+        fraction. Every segment has its mean taken out and a Hann window applied, and 
+        its periodogram is added up. Only the segment being filled and the sum are 
+        kept, so the memory does not grow with the length of the stream. The samples 
+        can be numbers or arrays, which gives a spectrum for every element."""
+    def __init__(self, nfft = 1024, dt = 1.0, overlap = .5):
+        """ Initiates an empty estimate.
+
+            nfft: number of samples of a segment
+            dt: time between samples
+            overlap: fraction of a segment shared with the next one """
+        self.nfft = nfft
+        self.dt = float(dt)
+        self.hop = nfft - int(overlap*nfft)
+        self.win = .5 - .5*np.cos(2*math.pi*np.arange(nfft)/nfft)
+        self.reset()
+
+    def reset(self):
+        """ Forgets every sample added so far."""
+        self.buf = None
+        self.fill = 0
+        self.acc = 0.0
+        self.segments = 0
+
+    def cut(self):
+        """ Starts a new stretch of the stream, dropping the samples of the segment being filled."""
+        self.fill = 0
+
+    def add(self, xs):
+        """ Adds the array of samples xs, in order along its first axis."""
+        xs = np.asarray(xs, dtype=float)
+        if self.buf is None:
+            self.buf = np.empty((self.nfft,) + xs.shape[1:])
+        k = 0
+        while k < len(xs):
+            m = min(self.nfft - self.fill, len(xs) - k)
+            self.buf[self.fill:self.fill + m] = xs[k:k + m]
+            self.fill += m
+            k += m
+            if self.fill == self.nfft:
+                seg = self.buf - self.buf.mean(0)
+                seg *= self.win.reshape((-1,) + (1,)*(seg.ndim - 1))
+                f = np.fft.rfft(seg, axis=0)
+                self.acc = self.acc + (f.real*f.real + f.imag*f.imag)
+                self.segments += 1
+                self.buf[:self.nfft - self.hop] = self.buf[self.hop:]
+                self.fill = self.nfft - self.hop
+
+    def freqs(self):
+        """ Returns the frequencies of the spectrum."""
+        return np.arange(self.nfft//2 + 1)/(self.nfft*self.dt)
+
+    def psd(self):
+        """ Returns the one-sided power spectral density at every frequency of freqs,
+            averaged over the segments so far (nan before the first segment is full)."""
+        if not self.segments:
+            out = np.empty((self.nfft//2 + 1,) + (self.buf.shape[1:] if self.buf is not None else ()))
+            out.fill(np.nan)
+            return out
+        p = self.acc*(self.dt/(self.win*self.win).sum()/self.segments)
+        p[1:(self.nfft + 1)//2] *= 2 # the Nyquist bin of an even nfft has no mirror image
+        return p
+
+class Timers:
+    """ Wall time and number of calls of named parts of a simulation."""
+    def __init__(self):
+        """ Initiates empty timers."""
+        self.times = {}
+        self.calls = {}
+
+    def add(self, name, secs, calls = 1):
+        """ Adds secs seconds spent in the part called name."""
+        self.times[name] = self.times.get(name, 0.0) + secs
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def wrap(self, name, fn):
+        """ Returns fn wrapped so that its calls are timed under name."""
+        def timed(*args):
+            start = time.time()
+            out = fn(*args)
+            self.add(name, time.time() - start)
+            return out
+        return timed
+
+    def merge(self, other):
+        """ Adds the times of the Timers other to these."""
+        for name in other.times:
+            self.add(name, other.times[name], other.calls[name])
\ No newline at end of file
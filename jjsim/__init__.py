@@ -1 +1 @@
-__all__ = ["JJs", "DiffSolver", "data.FileSetup", "data.IVPlot", "data.Phase"]
\ No newline at end of file
+__all__ = ["JJs", "DiffSolver", "Stats", "data.FileSetup", "data.IVPlot", "data.Phase", "data.Parallel", "data.Cache", "data.Output", "data.Progress", "data.Switching", "data.Strips", "data.Surrogate", "data.Checkpoint", "data.Spectrum", "data.Damping", "data.Scan"]
\ No newline at end of file
@@ -0,0 +1,174 @@
+import os, hashlib
+import cPickle as pickle
+import numpy as np
+
+def params(j):
+    """ Returns the tuple of the parameters that set the response of junction j,
+        or None if the junction can not be cached."""
+    if not hasattr(j, 'getState'):
+        return None
+    if j.getTemp() != 0 and not getattr(j, 'seeded', False):
+        return None # noisy junctions are only reproducible with a fixed seed
+    if j.getType() == 'array':
+        return (j.getType(), j.rows, j.cols, matrixHash(j.B), tuple(j.Iex), j.sig, j.dt, j.integrator, j.rtol, j.atol)
+    return (j.getType(), j.b, getattr(j, 'd', None), getattr(j, 'e', None),
+            getattr(j, 'sig', None), j.dt, j.integrator, j.tol, j.rtol, j.atol)
+
+def matrixHash(B):
+    """ Returns the sha1 digest of the entries of the matrix B, a list of lists,
+        a numpy array or a scipy sparse matrix."""
+    if hasattr(B, 'tocsr'):
+        B = B.tocsr()
+        B.sort_indices()
+        h = hashlib.sha1(repr(B.shape))
+        for a in (B.data, B.indices, B.indptr):
+            h.update(np.ascontiguousarray(a).tostring())
+    else:
+        B = np.ascontiguousarray(B, dtype=float)
+        h = hashlib.sha1(repr(B.shape))
+        h.update(B.tostring())
+    return h.hexdigest()
+
+class IVCache:
+    """ An on-disk cache of the results of applyI.
+
+        Every entry holds the average voltage and the final state of a junction
+        for one bias point. It is keyed on the junction parameters, the bias 
+        current, T, the initial state and, for noisy junctions, the state of 
+        their random stream. The least recently used entries are evicted once
+        the cache grows past maxsize bytes.
+
+        The cache also holds whole branches of continued sweeps (see IVPlot.continuation),
+        keyed on the state of the junctions at the start of the branch (see branchKey)."""
+    def __init__(self, path = 'ivcache', maxsize = 100*2**20):
+        """ Initiates the cache.
+
+            path: directory holding the cache (it is created if needed)
+            maxsize: largest size of the cache in bytes """
+        self.path = path
+        self.maxsize = maxsize
+        if not os.path.exists(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                pass # made by another process in the meantime
+
+    def key(self, j, i, T, settle = None):
+        """ Returns the key of applying current i to junction j for duration T, 
+            or None if the result can not be cached.
+
+            settle: fraction of T run before the averaging starts (see JJs.JJ.applyI)"""
+        ps = params(j)
+        if ps is None:
+            return None
+        if settle is None:
+            h = hashlib.sha1(repr((ps, float(i), float(T))))
+        else:
+            h = hashlib.sha1(repr((ps, float(i), float(T), float(settle))))
+        h.update(np.array(j.getState(), dtype=float).tostring()) # repr rounds and elides big arrays
+        self.noiseState(h, j)
+        return h.hexdigest()
+
+    def noiseState(self, h, j):
+        """ Adds the state of the random stream of junction j, if it is noisy, to the hash h."""
+        if j.getTemp() != 0:
+            st = j.rng.get_state()
+            h.update(st[1].tostring())
+            h.update(repr(st[2:]))
+            h.update(np.array(j.nbuf[j.nk:]).tostring())
+
+    def branchKey(self, js, i, T, settle, dv, down):
+        """ Returns the key of a branch of a continued sweep of the junctions js that starts 
+            at current i from their present state, or None if it can not be cached.
+
+            T, settle, dv: parameters of the continuation (see IVPlot.continuation)
+            down: whether the branch lowers the current"""
+        h = hashlib.sha1(repr(('branch', float(i), float(T), float(settle), float(dv), bool(down))))
+        for j in js:
+            ps = params(j)
+            if ps is None:
+                return None
+            h.update(repr(ps))
+            h.update(np.array(j.getState(), dtype=float).tostring())
+            self.noiseState(h, j)
+        return h.hexdigest()
+
+    def file(self, key):
+        """ Returns the file of the entry with the given key."""
+        return os.path.join(self.path, key + '.pkl')
+
+    def get(self, key):
+        """ Returns the entry with the given key, or None if it is not cached."""
+        fl = self.file(key)
+        try:
+            with open(fl, 'rb') as f:
+                entry = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            os.utime(fl, None) # marks the entry as recently used
+        except OSError:
+            pass # evicted by another process meanwhile, but it was read
+        return entry
+
+    def put(self, key, entry):
+        """ Stores the entry under the given key and evicts old entries if the cache is too big."""
+        fl = self.file(key)
+        tmp = '{0}.{1}.tmp'.format(fl, os.getpid()) # other processes may store the same entry
+        with open(tmp, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, fl)
+        self.evict()
+
+    def evict(self):
+        """ Deletes the least recently used entries until the cache fits in maxsize."""
+        entries = []
+        size = 0
+        for name in os.listdir(self.path):
+            if name.endswith('.pkl'):
+                try:
+                    st = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    continue # evicted by another process meanwhile
+                entries.append((st.st_mtime, st.st_size, name))
+                size += st.st_size
+        entries.sort()
+        for mtime, sz, name in entries:
+            if size <= self.maxsize:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass # already evicted by another process
+            size -= sz
+
+    def applyI(self, j, i = 0.0, T = 1000, settle = None):
+        """ Applies bias current i to junction j for duration T, like j.applyI. 
+            A cached result is used if there is one. Otherwise the junction is run 
+            and the result is stored. Returns the average voltage.
+
+            settle: fraction of T run before the averaging starts (see JJs.JJ.applyI)"""
+        key = self.key(j, i, T, settle)
+        kw = {} if settle is None else {'settle': settle}
+        if key is None:
+            return j.applyI(i, T, **kw)
+        entry = self.get(key)
+        if entry is not None:
+            j.i = i
+            j.setState(entry['state'])
+            j.steps = 0 # nothing was integrated
+            if 'converged' in entry:
+                j.converged = entry['converged']
+            if 'rng' in entry:
+                j.rng.set_state(entry['rng'])
+                j.nbuf, j.nk = entry['nbuf'], 0
+            return entry['v']
+        v = j.applyI(i, T, **kw)
+        entry = {'v': v, 'state': j.getState()}
+        if hasattr(j, 'converged'):
+            entry['converged'] = j.converged
+        if j.getTemp() != 0:
+            entry['rng'] = j.rng.get_state()
+            entry['nbuf'] = j.nbuf[j.nk:]
+        self.put(key, entry)
+        return v
\ No newline at end of file
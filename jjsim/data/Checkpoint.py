@@ -0,0 +1,101 @@
+import os, time
+import cPickle as pickle
+from jjsim import JJs
+
+def snapshot(j):
+    """ Returns what is needed to put junction j (or a JJs.JJEnsemble) back in its present state:
+        the variables of its diff eq, its bias current and the state of its noise."""
+    if isinstance(j, JJs.JJEnsemble):
+        return {'phase': j.phase.copy(), 'volt': j.volt.copy(), 'i': j.i.copy(), 'rng': j.rng.get_state()}
+    snap = {'state': j.getState(), 'i': j.i}
+    if hasattr(j, 'rng'):
+        snap['rng'] = j.rng.get_state()
+        snap['nbuf'], snap['nk'] = j.nbuf, j.nk
+    return snap
+
+def restore(j, snap):
+    """ Puts junction j (or a JJs.JJEnsemble) back in the state of snapshot snap."""
+    if isinstance(j, JJs.JJEnsemble):
+        j.phase[:], j.volt[:], j.i[:] = snap['phase'], snap['volt'], snap['i']
+        j.rng.set_state(snap['rng'])
+        j.sync()
+        return
+    j.setState(snap['state'])
+    j.i = snap['i']
+    if 'rng' in snap:
+        j.rng.set_state(snap['rng'])
+        j.nbuf, j.nk = snap['nbuf'], snap['nk']
+
+class Checkpoint:
+    """ Saves the progress of a sweep to a file, so that it can be resumed after a crash.
+
+        The checkpoint stands in for the Output writer of the sweep. It keeps the
+        rows written so far and, every few minutes, saves them to its file along with
+        the state of the junctions. A sweep given the file of an earlier checkpoint
+        restores the junctions, writes the saved rows again and goes on from the next
+        bias point. The file is deleted when the sweep is done."""
+    def __init__(self, fl, every = 600):
+        """ Initiates the checkpoint, loading it from fl if the file exists.
+
+            fl: checkpoint file
+            every: seconds between saves """
+        self.fl = fl
+        self.every = every
+        self.w = None
+        self.js = None
+        self.rows = []
+        self.done = 0
+        self.states = None
+        if os.path.exists(fl):
+            with open(fl, 'rb') as f:
+                saved = pickle.load(f)
+            self.rows, self.done, self.states = saved['rows'], saved['done'], saved['states']
+
+    def attach(self, w, js):
+        """ Starts recording the sweep of junctions js, written to the Output writer w.
+            Resumes a saved sweep: restores the junctions and writes its rows to w.
+            Returns the number of bias points already done."""
+        self.w = w
+        self.js = js
+        if self.states is not None:
+            if isinstance(js, JJs.JJEnsemble):
+                restore(js, self.states)
+            else:
+                for j, snap in zip(js, self.states):
+                    restore(j, snap)
+        for kind, values in self.rows:
+            getattr(w, kind)(values)
+        self.last = time.time()
+        return self.done
+
+    def row(self, values):
+        """ Writes a row of a finished bias point and saves the checkpoint if it is due."""
+        self.w.row(values)
+        self.rows.append(('row', list(values)))
+        self.done += 1
+        if time.time() - self.last >= self.every:
+            self.save()
+
+    def text(self, s):
+        """ Writes the text s between rows."""
+        self.w.text(s)
+        self.rows.append(('text', s))
+
+    def save(self):
+        """ Saves the rows and the state of the junctions to the checkpoint file."""
+        if isinstance(self.js, JJs.JJEnsemble):
+            states = snapshot(self.js)
+        else:
+            states = [snapshot(j) for j in self.js]
+        tmp = self.fl + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({'rows': self.rows, 'done': self.done, 'states': states}, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, self.fl)
+        self.last = time.time()
+
+    def close(self, runtime):
+        """ Closes the writer of the sweep, deletes the checkpoint file and returns the name of the data file."""
+        fl = self.w.close(runtime)
+        if os.path.exists(self.fl):
+            os.remove(self.fl)
+        return fl
\ No newline at end of file
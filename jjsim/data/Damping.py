@@ -1,29 +1,132 @@
 import math
-from jjsim import JJs
-import FileSetup as FS
+import numpy as np
+import Output
 import time, datetime
 
-def dampingPlot(j, w0, wmax, estep):
-	start_time = time.time()
+def coefficients(b, Q1, rho):
+    """ Returns the arrays of the coefficients d and e of the diff eq of JJs.JJFreq
+        for the arrays (or numbers) b, Q1 and rho, like JJs.JJFreq.__init__."""
+    b = np.asarray(b, dtype=float)
+    return np.sqrt(b)/np.asarray(Q1, dtype=float) - 1, np.asarray(rho, dtype=float)/b
+
+def frequencies(w0, wmax, estep):
+    """ Returns the log grid of frequencies from w0 up to (but not including) wmax,
+        estep decades apart."""
+    return w0*10**(estep*np.arange(int(math.ceil(math.log10(float(wmax)/w0)/estep))))
+
+def admittance(w, b, Q1, rho):
+    """ Returns the complex admittance of the shunt of a JJs.JJFreq at the angular frequencies w:
+        the resistor in parallel with the RC branch, 1 + d*iw/(e + iw).
+        The frequencies are in the units of the voltage, so a junction at voltage v
+        oscillates at w = v, and the plasma frequency is w = 1/sqrt(b).
+
+        w: array of frequencies
+        b, Q1, rho: parameters of the junctions, numbers or arrays of any (common) shape.
+                    The result has their shape followed by the shape of w"""
+    d, e = coefficients(b, Q1, rho)
+    d, e = d[..., np.newaxis], e[..., np.newaxis]
+    iw = 1j*np.asarray(w, dtype=float)
+    return 1 + d*iw/(e + iw)
+
+def damping(w, b, Q1, rho):
+    """ Returns the effective Stewart-McCumber damping constant at the angular frequencies w,
+        b over the square of the shunt conductance (see admittance). It is b at low
+        frequencies and Q1**2 at high frequencies."""
+    g = admittance(w, b, Q1, rho).real
+    return np.asarray(b, dtype=float)[..., np.newaxis]/(g*g)
+
+def impedance(w, b, Q1, rho):
+    """ Returns the complex impedance of a JJs.JJFreq at the angular frequencies w:
+        the shunt (see admittance) in parallel with the capacitance b."""
+    y = admittance(w, b, Q1, rho)
+    return 1/(y + 1j*np.asarray(b, dtype=float)[..., np.newaxis]*np.asarray(w, dtype=float))
+
+def frequencyResponse(w, b, Q1, rho):
+    """ Returns the effective damping (see damping) and the complex impedance (see impedance)
+        together, from a single evaluation of the admittance."""
+    y = admittance(w, b, Q1, rho)
+    b = np.asarray(b, dtype=float)[..., np.newaxis]
+    return b/(y.real*y.real), 1/(y + 1j*b*np.asarray(w, dtype=float))
+
+def response(js, w):
+    """ Returns the arrays of the effective damping and of the complex impedance of
+        every junction at the angular frequencies w, one row per junction.
+
+        js: list of JJs.JJFreq junctions"""
+    b = np.array([j.b for j in js])
+    Q1 = np.array([j.getQ1() for j in js])
+    rho = np.array([j.getRho() for j in js])
+    return frequencyResponse(w, b, Q1, rho)
+
+def dampingWriter(title, info, w0, wmax, estep, fl, fmt, colhead, rowfmt, columns):
+    """ Returns an Output writer with the heading of a damping plot.
+
+        title: first line of the heading
+        info: list of the heading lines describing the junctions"""
     nw = datetime.datetime.now()
-    fl = FS.fileSetup(fl)
-    f = open(fl, 'w')
-    # write heading
-    f.write('Frequency Dependent Damping Plot \n')
-    f.write('Type of Junction:     {0} \n'.format(js[0].getType()))
-    f.write('Junctions Info:       {0} \n'.format(js[0].getInfo()))
-    f.write('frequency range, dw:  {1}-{2}, {0} \n'.format(dw, w0, wmax))
-    f.write('Date:                 {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year))
-    f.write('Time:                 {0}:{1} \n'.format(nw.hour, nw.minute))
-
-    w = w0
-    out = 'Frequency    Damping \n(w)          (b) \n'
-    while (w < wmax):
-        out += '{0:.3e}'.format(w)
-        b = b0((1 + math.sqrt(b0/b1)*b0*p**-2*(w/wp)**2)/(1 + b0**2/b1*p**-2*(w/wp)**2))**2
-        out += '    {0:+.8e} \n'.format(b)
-        w *= 10**estep
-    f.write('Runtime:            {0} \n\n'.format(time.time() - start_time))
-    f.write(out)
-    f.close()
-    print('done with {0}'.format(fl))
\ No newline at end of file
+    head = ([title] + info +
+            ['frequency range, estep:  {1}-{2}, {0} \n'.format(estep, w0, wmax),
+             'Date:                    {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year),
+             'Time:                    {0}:{1} \n'.format(nw.hour, nw.minute)])
+    return Output.writer(fl, head, colhead, rowfmt, columns, fmt)
+
+def dampingPlot(js, w0 = .01, wmax = 100, estep = .01, fl='test.dat', fmt='dat'):
+    """ Produces data file with the frequency dependent damping and impedance of
+        the junctions, one block of rows for every junction.
+
+        js: list of JJs.JJFreq junctions
+        w0: lowest angular frequency
+        wmax: max angular frequency
+        estep: decades between frequencies
+        fl: data file to write
+        fmt: 'dat' for a text file or 'npy' for binary columns (see Output)"""
+    start_time = time.time()
+    w = frequencies(w0, wmax, estep)
+    bs, zs = response(js, w)
+    out = dampingWriter('Frequency Dependent Damping Plot \n',
+                        ['No. of Junctions:        {0} \n'.format(len(js)),
+                         'Type of Junctions:       {0} \n'.format(js[0].getType()),
+                         'Junctions Info:          {0} \n'.format(js[0].getInfo())],
+                        w0, wmax, estep, fl, fmt,
+                        'Frequency    Damping            Impedance \n(w)          (b)                (Re Z)             (Im Z) \n',
+                        '{1:.3e}    {2:+.8e}    {3:+.8e}    {4:+.8e} \n',
+                        ['junction', 'w', 'b', 'ReZ', 'ImZ'])
+    for k in xrange(len(js)):
+        out.rows(np.column_stack((np.repeat(k, len(w)), w, bs[k], zs[k].real, zs[k].imag)))
+        out.text('\n')
+    fl = out.close(time.time() - start_time)
+    print('done with {0}'.format(fl))
+
+def dampingGrid(b, Q1, rho, w0 = .01, wmax = 100, estep = .01, fl='test.npy', fmt='npy'):
+    """ Produces data file with the frequency dependent damping and impedance over
+        every combination of the parameters b, Q1 and rho of JJs.JJFreq.
+        Returns the arrays of the frequencies, the damping and the complex impedance,
+        the last two of shape (len(b), len(Q1), len(rho), len(frequencies)).
+
+        b, Q1, rho: lists of the parameter values
+        w0: lowest angular frequency
+        wmax: max angular frequency
+        estep: decades between frequencies
+        fl: data file to write (None writes nothing)
+        fmt: 'dat' for a text file or 'npy' for binary columns (see Output)"""
+    start_time = time.time()
+    w = frequencies(w0, wmax, estep)
+    B, Q, R = np.meshgrid(b, Q1, rho, indexing='ij')
+    bs, zs = frequencyResponse(w, B, Q, R)
+    if fl is None:
+        return w, bs, zs
+    out = dampingWriter('Frequency Dependent Damping Grid \n',
+                        ['b:                       {0} \n'.format(list(b)),
+                         'Q1:                      {0} \n'.format(list(Q1)),
+                         'rho:                     {0} \n'.format(list(rho))],
+                        w0, wmax, estep, fl, fmt,
+                        'b        Q1       rho      Frequency    Damping            Impedance \n'
+                        '(b)      (Q1)     (rho)    (w)          (b)                (Re Z)             (Im Z) \n',
+                        '{0:<8n} {1:<8n} {2:<8n} {3:.3e}    {4:+.8e}    {5:+.8e}    {6:+.8e} \n',
+                        ['b', 'Q1', 'rho', 'w', 'beff', 'ReZ', 'ImZ'])
+    n = len(w)
+    out.rows(np.column_stack((np.repeat(B.ravel(), n), np.repeat(Q.ravel(), n), np.repeat(R.ravel(), n),
+                              np.tile(w, B.size), bs.ravel(), zs.real.ravel(), zs.imag.ravel())))
+    fl = out.close(time.time() - start_time)
+    print('done with {0}'.format(fl))
+    return w, bs, zs
\ No newline at end of file
@@ -3,13 +3,12 @@ import os
 def fileSetup(fl='test.dat'):
     """ Sets up the file. Returns file to be written."""
     dir = os.path.dirname(fl)
-    print(dir)
     if not os.path.exists(dir) and dir != "":
         os.makedirs(dir)
+    root, ext = os.path.splitext(fl)
     fil = fl
     k = 2
     while os.path.exists(fil):
-        fil = '{0}_{1}.dat'.format(fl[:-4], k)
+        fil = '{0}_{1}{2}'.format(root, k, ext)
         k+=1
-    print(fil)
     return fil
\ No newline at end of file
@@ -1,9 +1,367 @@
 import math
+import numpy as np
 from jjsim import JJs
-import FileSetup as FS
+import Parallel
+import Output
+import Progress
+import Checkpoint
 import time, datetime
 
-def IVPlot(js, T, di = .01, i0 = 0, imax=1.5, fl='test.dat'):
+def applyAll(js, i, T, cache = None, settle = None):
+    """ Applies bias current i to every junction for duration T.
+        Returns a list with the average voltage of each junction.
+
+        js: list of junctions or a JJs.JJEnsemble
+        i: bias current
+        T: duration of junction averaging
+        cache: Cache.IVCache consulted before running each junction
+        settle: fraction of T run before the averaging starts (None is three fifths, see JJs.JJ.applyI)"""
+    if settle is not None:
+        if isinstance(js, JJs.JJEnsemble):
+            return js.applyI(i, T, settle = settle).tolist()
+        if cache is not None:
+            return [cache.applyI(j, i, T, settle) for j in js]
+        return [j.applyI(i, T, settle = settle) for j in js]
+    if isinstance(js, JJs.JJEnsemble):
+        return js.applyI(i, T).tolist()
+    if cache is not None:
+        return [cache.applyI(j, i, T) for j in js]
+    return [j.applyI(i, T) for j in js]
+
+def currents(i0, imax, di):
+    """ Returns the list of bias currents of a sweep from i0 up to (but not including) imax.
+        A negative di lowers the current from i0 down to imax instead."""
+    cs = []
+    i = i0
+    while (i < imax if di > 0 else i > imax):
+        cs.append(i)
+        i += di
+    return cs
+
+def batchAll(js, cs, T, seed = None, timers = None):
+    """ Applies every bias current in cs to a copy of every junction at once.
+        Returns a list with, for each current, the list of the average voltages of the junctions.
+
+        Every bias point starts from the present state of the junctions, 
+        so this is only valid for sweeps without hysteresis. The junctions are 
+        left in the state of the last bias point.
+
+        js: list of simple or noisy junctions, or a JJs.JJEnsemble
+        cs: list of bias currents
+        T: duration of junction averaging
+        seed: seed for the noise of the batch (None seeds randomly)
+        timers: Stats.Timers the batch is counted in, or None"""
+    if isinstance(js, JJs.JJEnsemble):
+        js = js.js
+    e = JJs.JJEnsemble(js, reps = len(cs), seed = seed)
+    e.timers = timers
+    vs = e.applyI(np.repeat(cs, len(js)), T)
+    return vs.reshape(len(cs), len(js)).tolist()
+
+def sweepJunction(args):
+    """ Applies every current of a sweep in turn to one junction. 
+        Returns the junction, the list of its average voltages and the list of 
+        the (steps, seconds, converged) of every current.
+
+        args: tuple of the junction, the list of currents, T and the cache (or None)"""
+    j, cs, T, cache = args
+    vs = []
+    work = []
+    for i in cs:
+        start = time.time()
+        vs.append(applyAll([j], i, T, cache)[0])
+        steps, conv = Progress.work([j])
+        work.append((steps, time.time() - start, conv))
+    return j, vs, work
+
+def sweepAll(js, cs, T, workers = 1, cache = None, queue = None):
+    """ Applies every current of a sweep in turn to the junctions, with the 
+        junctions spread over a pool of worker processes.
+        Returns a list with, for each current, the list of the average voltages of the junctions
+        and a list with the (steps, seconds, converged) of each current, added over the junctions.
+
+        The junctions are left in their final state. Seed them first 
+        (see Parallel.seedAll) to make noisy runs reproducible.
+
+        js: list of junctions
+        cs: list of bias currents
+        T: duration of junction averaging
+        workers: number of processes
+        cache: Cache.IVCache consulted before running each junction
+        queue: Parallel.WorkQueue (or its directory) that the junctions are put on, one task each, 
+               so that other machines can run some of them"""
+    if isinstance(js, JJs.JJEnsemble):
+        raise Exception('Workers need a list of junctions, not an ensemble')
+    res = Parallel.runTasks(sweepJunction, [(j, cs, T, cache) for j in js], workers, queue)
+    for j, r in zip(js, res):
+        j.__dict__.update(r[0].__dict__)
+    work = []
+    for ws in zip(*[r[2] for r in res]):
+        conv = sum([w[2] or [] for w in ws], [])
+        work.append((sum(w[0] for w in ws), sum(w[1] for w in ws), conv or None))
+    return [list(vs) for vs in zip(*[r[1] for r in res])], work
+
+def sweep(js, cs, T, track, batch = False, workers = 1, seed = None, cache = None, lower = None, queue = None, skip = 0):
+    """ Runs the bias points of a sweep in order and reports each of them to track.
+        Yields the current and the list of the average voltages of the junctions for every point.
+
+        js: list of junctions or a JJs.JJEnsemble
+        cs: list of bias currents
+        T: duration of junction averaging
+        track: Progress.Tracker of the sweep
+        batch: simulate all bias points at once (see batchAll)
+        workers: number of processes the junctions are spread over (see sweepAll)
+        seed: seed for the noise of a batch
+        cache: Cache.IVCache consulted before running each junction
+        lower: index of the first point that lowers the current in a hysteresis sweep
+        queue: Parallel.WorkQueue the junctions are spread over (see sweepAll)
+        skip: number of points at the start that are already done, from a checkpoint"""
+    if batch:
+        start = time.time()
+        vss = batchAll(js, cs, T, seed, track.timers)
+        secs = (time.time() - start)/len(cs)
+        work = [(len(js)*int(T/js[0].dt), secs, None)]*len(cs)
+    elif workers > 1 or queue is not None:
+        vss, work = sweepAll(js, cs, T, workers, cache, queue)
+        if track.timers is not None:
+            track.timers = Progress.gather(js)
+    track.k = skip
+    for k, i in enumerate(cs):
+        if k < skip:
+            continue
+        if k == lower:
+            track.report('lower', 'Lowering current')
+        if batch or workers > 1 or queue is not None:
+            vs = vss[k]
+            track.point(i, *work[k])
+        else:
+            vs = applyAll(js, i, T, cache)
+            track.point(i)
+        yield i, vs
+
+def runFrom(js, states, i, T, cache, track):
+    """ Applies bias current i to the junctions, started from states (None keeps their present state).
+        Returns the current, the list of the average voltages and the list of the final states of the junctions."""
+    if states is not None:
+        for j, x in zip(js, states):
+            j.setState(x)
+    vs = applyAll(js, i, T, cache)
+    track.point(i)
+    return i, vs, [j.getState() for j in js]
+
+def jump(a, b, dv):
+    """ Returns whether the voltage of a junction changes by more than dv between the points a and b."""
+    return max(abs(x - y) for x, y in zip(a[1], b[1])) > dv
+
+def adaptive(js, cs, T, track, dimin, dv = .05, cache = None, down = False):
+    """ Runs a sweep over the coarse currents cs and then bisects the intervals where 
+        the voltage of a junction jumps by more than dv, or where the up and down 
+        branches of a hysteresis sweep stop agreeing, until they are at most dimin wide.
+        Returns the list of the (current, voltages, states) of the points raising the current
+        and the list of those lowering it, both in increasing current.
+
+        A new point starts from the state of its neighbour on the side the sweep comes from,
+        so it sees the same history as it would on a fine uniform grid.
+
+        js: list of junctions
+        cs: list of increasing bias currents of the coarse grid
+        T: duration of junction averaging
+        track: Progress.Tracker of the sweep
+        dimin: target current resolution
+        dv: voltage change that is resolved
+        cache: Cache.IVCache consulted before running each junction
+        down: also lower the current back through cs (a hysteresis sweep)"""
+    if isinstance(js, JJs.JJEnsemble):
+        raise Exception('Adaptive sweeps need a list of junctions, not an ensemble')
+    up = [runFrom(js, None, i, T, cache, track) for i in cs]
+    dn = []
+    if down:
+        track.report('lower', 'Lowering current')
+        dn = [runFrom(js, None, i, T, cache, track) for i in reversed(cs)][::-1]
+    while True:
+        ks = []
+        for k in xrange(len(up) - 1):
+            if up[k + 1][0] - up[k][0] <= dimin:
+                continue
+            if jump(up[k], up[k + 1], dv) or (down and (jump(dn[k], dn[k + 1], dv) or 
+                    max(abs(u0 - d0 - u1 + d1) for u0, d0, u1, d1 in 
+                        zip(up[k][1], dn[k][1], up[k + 1][1], dn[k + 1][1])) > dv)):
+                ks.append(k)
+        if not ks:
+            break
+        track.points += len(ks)*(2 if down else 1)
+        for k in reversed(ks):
+            m = (up[k][0] + up[k + 1][0])/2.0
+            up.insert(k + 1, runFrom(js, up[k][2], m, T, cache, track))
+            if down:
+                dn.insert(k + 1, runFrom(js, dn[k + 1][2], m, T, cache, track))
+    for j, x in zip(js, dn[0][2] if down else up[-1][2]):
+        j.setState(x)
+    return up, dn
+
+def extrapolate(a, b, i, dv):
+    """ Returns the states of the junctions at current i, extrapolated linearly from the points
+        a and b (current, voltages, states) of a branch, with None for the junctions that keep 
+        their present state.
+
+        Only junctions in the zero voltage state at both points are extrapolated, since their 
+        state is a fixed point that moves smoothly with the current. A running junction is 
+        already on its limit cycle, and where on it a point ended says nothing about the next."""
+    w = (i - b[0])/(b[0] - a[0])
+    out = []
+    for va, vb, xa, xb in zip(a[1], b[1], a[2], b[2]):
+        xa, xb = np.array(xa, dtype=float), np.array(xb, dtype=float)
+        if abs(va) > dv or abs(vb) > dv or np.abs(xb - xa).max() > math.pi:
+            out.append(None) # running, or a phase wrapped between the points
+        else:
+            out.append(xb + w*(xb - xa))
+    return out
+
+def settlePoint(js, prev, i, T, track, settle, dv):
+    """ Runs bias point i of a branch that goes on from its last points prev (current, voltages, states).
+        Returns the current, the list of the average voltages and the list of the final states of the junctions.
+
+        The junctions start from the state extrapolated from the last two points and settle 
+        for settle*T. A point whose voltage is more than dv away from the line through the last 
+        two points has switched, or had not settled, and is run again with the full settling. 
+        So is the first point of a branch."""
+    start = time.time()
+    steps = 0
+    if prev:
+        if len(prev) == 2:
+            for j, x in zip(js, extrapolate(prev[0], prev[1], i, dv)):
+                if x is not None:
+                    j.setState(x)
+            w = (i - prev[1][0])/(prev[1][0] - prev[0][0])
+            guess = [vb + w*(vb - va) for va, vb in zip(prev[0][1], prev[1][1])]
+        else:
+            guess = prev[-1][1]
+        vs = applyAll(js, i, T, None, settle)
+        steps, conv = Progress.work(js)
+    if not prev or max(abs(v - g) for v, g in zip(vs, guess)) > dv:
+        vs = applyAll(js, i, T)
+        more, conv = Progress.work(js)
+        steps += more
+    track.point(i, steps, time.time() - start, conv)
+    return i, vs, [j.getState() for j in js]
+
+def branch(js, cs, T, track, settle, dv = .05, cache = None, down = False, skip = 0):
+    """ Runs the bias points cs of one branch of a continued sweep in order (see settlePoint).
+        Yields the current and the list of the average voltages of the junctions for every point.
+
+        With a cache, the branch is stored under the state of the junctions at its start.
+        A branch that starts from the same state reuses the points it shares with the stored 
+        one and only runs the rest. The stored noise streams are only those at the end 
+        of the branch, so noisy junctions can only go on from its last point.
+
+        js: list of junctions
+        cs: list of bias currents
+        T: duration of junction averaging
+        track: Progress.Tracker of the sweep
+        settle: fraction of T a continued point settles for
+        dv: voltage change that counts as a switch
+        cache: Cache.IVCache that branches are stored in and reused from
+        down: whether the branch lowers the current
+        skip: number of points at the start that are already done, from a checkpoint"""
+    key = None
+    if cache is not None and skip == 0 and cs:
+        key = cache.branchKey(js, cs[0], T, settle, dv, down)
+    saved = cache.get(key) if key is not None else None
+    n = 0
+    if saved is not None:
+        while n < min(len(cs), len(saved['cs'])) and saved['cs'][n] == cs[n]:
+            n += 1
+        if n < len(saved['cs']) and any(j.getTemp() != 0 for j in js):
+            n = 0
+    pts = []
+    for k, i in enumerate(cs):
+        if k < skip:
+            continue
+        if k < n:
+            for j, x in zip(js, saved['states'][k]):
+                j.setState(x)
+                j.i = i
+            if k == len(saved['cs']) - 1:
+                for j, snap in zip(js, saved['end']):
+                    Checkpoint.restore(j, snap)
+            pts.append((i, saved['vs'][k], saved['states'][k]))
+            track.point(i, 0, None, None)
+        else:
+            pts.append(settlePoint(js, pts[-2:], i, T, track, settle, dv))
+        yield i, pts[-1][1]
+    if key is not None and len(pts) > n:
+        cache.put(key, {'cs': cs, 'vs': [p[1] for p in pts], 'states': [p[2] for p in pts],
+                        'end': [Checkpoint.snapshot(j) for j in js]})
+
+def continuation(js, cs, ds, T, track, settle, dv = .05, cache = None, skip = 0):
+    """ Runs a hysteresis sweep that raises the current through cs and lowers it through ds, 
+        continuing every point from its neighbours on the same branch (see branch).
+        Yields the current and the list of the average voltages of the junctions for every point.
+
+        A point that follows a smooth part of its branch only settles for settle*T instead 
+        of three fifths of T. The averaging still takes two fifths of T. A sweep resumed
+        from a checkpoint has no points to go on from, so its next point settles fully
+        and the rest of the sweep only agrees with an uninterrupted one to within the
+        accuracy of the continuation.
+
+        js: list of junctions
+        cs, ds: lists of the currents raising and lowering the current
+        T: duration of junction averaging
+        track: Progress.Tracker of the sweep
+        settle: fraction of T a continued point settles for
+        dv: voltage change that counts as a switch
+        cache: Cache.IVCache that branches are stored in and reused from
+        skip: number of points at the start that are already done, from a checkpoint"""
+    if isinstance(js, JJs.JJEnsemble):
+        raise Exception('Continued sweeps need a list of junctions, not an ensemble')
+    track.k = skip
+    for pt in branch(js, cs, T, track, settle, dv, cache, False, skip):
+        yield pt
+    if skip <= len(cs):
+        track.report('lower', 'Lowering current')
+    for pt in branch(js, ds, T, track, settle, dv, cache, True, max(skip - len(cs), 0)):
+        yield pt
+
+def resume(w, js, checkpoint, serial):
+    """ Returns the writer of a sweep and the number of its bias points that are already done.
+        With a checkpoint, the writer is the checkpoint, which saves the progress of the sweep
+        (see Checkpoint.Checkpoint) and resumes it if it was saved before.
+
+        w: Output writer of the sweep
+        js: junctions of the sweep
+        checkpoint: Checkpoint.Checkpoint or its file, or None for no checkpoints
+        serial: whether the sweep runs its bias points one at a time in this process"""
+    if checkpoint is None:
+        return w, 0
+    if not serial:
+        raise Exception('Checkpoints need a sweep that runs one bias point at a time')
+    if not isinstance(checkpoint, Checkpoint.Checkpoint):
+        checkpoint = Checkpoint.Checkpoint(checkpoint)
+    return checkpoint, checkpoint.attach(w, js)
+
+def ivWriter(title, js, T, di, i0, imax, fl, fmt, each = False):
+    """ Returns an Output writer with the heading of an IV plot.
+
+        title: first line of the heading
+        each: also write the voltage of every junction, on its own line in the text format"""
+    nw = datetime.datetime.now()
+    head = [title,
+            'No. of Junctions:    {0} \n'.format(len(js)),
+            'Type of Junctions:  {0} \n'.format(js[0].getType()),
+            'Junctions Info:     {0} \n'.format(js[0].getInfo()),
+            'dt, T:              {0}, {1} \n'.format(js[0].dt, T),
+            'current range, di:  {1}-{2}, {0} \n'.format(di, i0, imax),
+            'Date:               {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year),
+            'Time:               {0}:{1} \n'.format(nw.hour, nw.minute)]
+    colhead = 'Current    Voltage \n(i)        (v) \n'
+    rowfmt = '{0:.5f}    {1:+.8f} \n'
+    columns = ['i', 'v']
+    if each:
+        rowfmt += ''.join(['    {%d:+.8f}' % (k + 2) for k in xrange(len(js))]) + '\n'
+        columns += ['v%d' % k for k in xrange(len(js))]
+    return Output.writer(fl, head, colhead, rowfmt, columns, fmt)
+
+def IVPlot(js, T, di = .01, i0 = 0, imax=1.5, fl='test.dat', batch=False, workers=1, seed=None, cache=None, fmt='dat', progress=None, counters=False, dimin=None, dv=.05, checkpoint=None, queue=None):
     """ Produces data file with an IV curve that is averaged over the junctions.
 
         js: list of junctions used
@@ -12,40 +370,40 @@ def IVPlot(js, T, di = .01, i0 = 0, imax=1.5, fl='test.dat'):
         di: current step
         i0: initial current
         imax: max current
-        fl: data file to write"""
+        fl: data file to write
+        batch: simulate all bias points at once (see batchAll)
+        workers: number of processes the junctions are spread over
+        seed: seed for the noise of the junctions (see Parallel.seedAll)
+        cache: Cache.IVCache of earlier results, consulted before running a junction
+        fmt: 'dat' for a text file or 'npy' for binary columns (see Output)
+        progress: callback receiving the progress reports (see Progress.Tracker), None prints them
+        counters: also count the time spent in the integrator, derivative and noise
+        dimin: refine the di grid down to dimin where the voltage jumps, in this process (see adaptive).
+               None keeps the grid uniform
+        dv: voltage jump resolved by the refinement
+        checkpoint: Checkpoint.Checkpoint or file that the sweep saves its progress to, and resumes from
+        queue: Parallel.WorkQueue or directory that the junctions are put on, so that 
+               other machines can help with the sweep (see Parallel.WorkQueue)"""
     start_time = time.time()
-    nw = datetime.datetime.now()
-    fl = FS.fileSetup(fl)
-    f = open(fl, 'w')
-    # write heading
-    f.write('IV Plot \n')
-    f.write('No. of Junctions:    {0} \n'.format(len(js)))
-    f.write('Type of Junctions:  {0} \n'.format(js[0].getType()))
-    f.write('Junctions Info:     {0} \n'.format(js[0].getInfo()))
-    f.write('dt, T:              {0}, {1} \n'.format(js[0].dt, T))
-    f.write('current range, di:  {1}-{2}, {0} \n'.format(di, i0, imax))
-    f.write('Date:               {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year))
-    f.write('Time:               {0}:{1} \n'.format(nw.hour, nw.minute))
+    if seed is not None or workers > 1 or queue is not None:
+        Parallel.seedAll(js, seed)
+    timers = Progress.count(js) if counters else None
+    w = ivWriter('IV Plot \n', js, T, di, i0, imax, fl, fmt)
+    w, done = resume(w, js, checkpoint, not batch and workers <= 1 and queue is None and dimin is None)
 
-    i = i0
-    out = 'Current    Voltage \n(i)        (v) \n'
-    while (i < imax):
-        out = ''.join([out, '{0:.5f}'.format(i)])
-        sumv = 0.0
-        vtot = 0
-        for j in js:
-            v = j.applyI(i, T)
-            sumv += v
-            vtot += 1
-        out = ''.join([out, '    {0:+.8f} \n'.format(sumv/vtot)])
-        print('{0} run for {1} seconds'.format(i, time.time() - start_time))
-        i += di
-    f.write('Runtime:            {0} \n\n'.format(time.time() - start_time))
-    f.write(out)
-    f.close()
-    print('done with {0}'.format(fl))
+    cs = currents(i0, imax, di)
+    track = Progress.Tracker(js, len(cs), progress, timers)
+    track.report('start')
+    if dimin is not None:
+        pts = [p[:2] for p in adaptive(js, cs, T, track, dimin, dv, cache)[0]]
+    else:
+        pts = sweep(js, cs, T, track, batch, workers, seed, cache, queue = queue, skip = done)
+    for i, vs in pts:
+        w.row([i, sum(vs)/len(vs)])
+    fl = w.close(time.time() - start_time)
+    track.done(fl, 'done with {0}'.format(fl))
 
-def hyst(js, T, di = .01, i0 = 0, imax=1.5, fl='test.dat'):
+def hyst(js, T, di = .01, i0 = 0, imax=1.5, fl='test.dat', workers=1, seed=None, cache=None, fmt='dat', progress=None, counters=False, dimin=None, dv=.05, checkpoint=None, queue=None, settle=None):
     """ Produces data file with an hysteric IV curve that is averaged over the junctions.
 
         js: list of junctions used
@@ -54,53 +412,48 @@ def hyst(js, T, di = .01, i0 = 0, imax=1.5, fl='test.dat'):
         di: current step
         i0: initial current
         imax: max current
-        fl: data file to write"""
+        fl: data file to write
+        workers: number of processes the junctions are spread over
+        seed: seed for the noise of the junctions (see Parallel.seedAll)
+        cache: Cache.IVCache of earlier results, consulted before running a junction
+        fmt: 'dat' for a text file or 'npy' for binary columns (see Output)
+        progress: callback receiving the progress reports (see Progress.Tracker), None prints them
+        counters: also count the time spent in the integrator, derivative and noise
+        dimin: refine the di grid down to dimin where the voltage jumps, in this process (see adaptive).
+               None keeps the grid uniform
+        dv: voltage jump resolved by the refinement, or that counts as a switch of a continued sweep
+        checkpoint: Checkpoint.Checkpoint or file that the sweep saves its progress to, and resumes from
+        queue: Parallel.WorkQueue or directory that the junctions are put on, so that 
+               other machines can help with the sweep (see Parallel.WorkQueue)
+        settle: continue every point from its neighbours and settle it for settle*T, in this 
+                process (see continuation). The cache then stores whole branches. None runs 
+                every point for the full T"""
     start_time = time.time()
-    nw = datetime.datetime.now()
-    fl = FS.fileSetup(fl)
-    f = open(fl, 'w')
-    # write heading
-    f.write('Hysteric IV Plot \n')
-    f.write('No. of Junctions:    {0} \n'.format(len(js)))
-    f.write('Type of Junctions:  {0} \n'.format(js[0].getType()))
-    f.write('Junctions Info:     {0} \n'.format(js[0].getInfo()))
-    f.write('dt, T:              {0}, {1} \n'.format(js[0].dt, T))
-    f.write('current range, di:  {1}-{2}, {0} \n'.format(di, i0, imax))
-    f.write('Date:               {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year))
-    f.write('Time:               {0}:{1} \n'.format(nw.hour, nw.minute))
+    if seed is not None or workers > 1 or queue is not None:
+        Parallel.seedAll(js, seed)
+    timers = Progress.count(js) if counters else None
+    w = ivWriter('Hysteric IV Plot \n', js, T, di, i0, imax, fl, fmt)
+    w, done = resume(w, js, checkpoint, (workers <= 1 and queue is None or settle is not None) and dimin is None)
 
-    i = i0
-    out = 'Current    Voltage \n(i)        (v) \n'
-    while (i < imax):
-        out = ''.join([out, '{0:.5f}'.format(i)])
-        sumv = 0.0
-        vtot = 0
-        for j in js:
-            v = j.applyI(i, T)
-            sumv += v
-            vtot += 1
-        out = ''.join([out, '    {0:+.8f} \n'.format(sumv/vtot)])
-        print('{0} run for {1} seconds'.format(i, time.time() - start_time))
-        i += di
-    i = imax
-    print('Lowering current')
-    while (i > i0):
-        out = ''.join([out, '{0:.5f}'.format(i)])
-        sumv = 0.0
-        vtot = 0
-        for j in js:
-            v = j.applyI(i, T)
-            sumv += v
-            vtot += 1
-        out = ''.join([out, '    {0:+.8f} \n'.format(sumv/vtot)])
-        print('{0} run for {1} seconds'.format(i, time.time() - start_time))
-        i -= di
-    f.write('Runtime:            {0} \n\n'.format(time.time() - start_time))
-    f.write(out)
-    f.close()
-    print('done  {0}'.format(fl))
-
-def allIVPlot(js, T = 1000, di = .01, i0 = 0.0, imax=1.5, fl='test.dat'):
+    cs = currents(i0, imax, di)
+    ds = currents(imax, i0, -di)
+    track = Progress.Tracker(js, len(cs) + len(ds), progress, timers)
+    track.report('start')
+    if dimin is not None:
+        cs += ds[:1]
+        track.points = 2*len(cs)
+        up, dn = adaptive(js, cs, T, track, dimin, dv, cache, True)
+        pts = [p[:2] for p in up + dn[::-1]]
+    elif settle is not None:
+        pts = continuation(js, cs, ds, T, track, settle, dv, cache, done)
+    else:
+        pts = sweep(js, cs + ds, T, track, False, workers, cache = cache, lower = len(cs), queue = queue, skip = done)
+    for i, vs in pts:
+        w.row([i, sum(vs)/len(vs)])
+    fl = w.close(time.time() - start_time)
+    track.done(fl, 'done  {0}'.format(fl))
+
+def allIVPlot(js, T = 1000, di = .01, i0 = 0.0, imax=1.5, fl='test.dat', batch=False, workers=1, seed=None, cache=None, fmt='dat', progress=None, counters=False, dimin=None, dv=.05, checkpoint=None, queue=None):
     """ Produces data file with an IV curve that is averaged over the junctions
         along with data from each individual junction.
 
@@ -110,45 +463,40 @@ def allIVPlot(js, T = 1000, di = .01, i0 = 0.0, imax=1.5, fl='test.dat'):
         di: current step
         i0: initial current
         imax: max current
-        fl: data file to write"""
+        fl: data file to write
+        batch: simulate all bias points at once (see batchAll)
+        workers: number of processes the junctions are spread over
+        seed: seed for the noise of the junctions (see Parallel.seedAll)
+        cache: Cache.IVCache of earlier results, consulted before running a junction
+        fmt: 'dat' for a text file or 'npy' for binary columns (see Output)
+        progress: callback receiving the progress reports (see Progress.Tracker), None prints them
+        counters: also count the time spent in the integrator, derivative and noise
+        dimin: refine the di grid down to dimin where the voltage jumps, in this process (see adaptive).
+               None keeps the grid uniform
+        dv: voltage jump resolved by the refinement
+        checkpoint: Checkpoint.Checkpoint or file that the sweep saves its progress to, and resumes from
+        queue: Parallel.WorkQueue or directory that the junctions are put on, so that 
+               other machines can help with the sweep (see Parallel.WorkQueue)"""
     start_time = time.time()
-    nw = datetime.datetime.now()
-    fl = FS.fileSetup(fl)
-    f = open(fl, 'w')
-    # write heading
-    f.write('IV Plot with individual junctions\n')
-    f.write('No. of Junctions:    {0} \n'.format(len(js)))
-    f.write('Type of Junctions:  {0} \n'.format(js[0].getType()))
-    f.write('Junctions Info:     {0} \n'.format(js[0].getInfo()))
-    f.write('dt, T:              {0}, {1} \n'.format(js[0].dt, T))
-    f.write('current range, di:  {1}-{2}, {0} \n'.format(di, i0, imax))
-    f.write('Date:               {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year))
-    f.write('Time:               {0}:{1} \n'.format(nw.hour, nw.minute))
+    if seed is not None or workers > 1 or queue is not None:
+        Parallel.seedAll(js, seed)
+    timers = Progress.count(js) if counters else None
+    w = ivWriter('IV Plot with individual junctions\n', js, T, di, i0, imax, fl, fmt, True)
+    w, done = resume(w, js, checkpoint, not batch and workers <= 1 and queue is None and dimin is None)
 
-    i = i0
-    out = 'Current    Voltage \n(i)        (v) \n'
-    while (i < imax):
-        out = ''.join([out, '{0:.5f}'.format(i)])
-        vs = []
-        sumv = 0.0
-        vtot = 0
-        for j in js:
-            v = j.applyI(i, T)
-            vs.append(v)
-            sumv += v
-            vtot += 1
-        out = ''.join([out, '    {0:+.8f} \n'.format(sumv/vtot)])
-        for v_ in vs:
-            out = ''.join([out, '    {0:+.8f}'.format(v_)])
-        out = ''.join([out, '\n'])
-        print('{0} run for {1} seconds'.format(i, time.time() - start_time))
-        i += di
-    f.write('Runtime:            {0} \n\n'.format(time.time() - start_time))
-    f.write(out)
-    f.close()
-    print('done with {0}'.format(fl))
+    cs = currents(i0, imax, di)
+    track = Progress.Tracker(js, len(cs), progress, timers)
+    track.report('start')
+    if dimin is not None:
+        pts = [p[:2] for p in adaptive(js, cs, T, track, dimin, dv, cache)[0]]
+    else:
+        pts = sweep(js, cs, T, track, batch, workers, seed, cache, queue = queue, skip = done)
+    for i, vs in pts:
+        w.row([i, sum(vs)/len(vs)] + vs)
+    fl = w.close(time.time() - start_time)
+    track.done(fl, 'done with {0}'.format(fl))
 
-def allHyst(js, T, di = .01, i0 = 0, imax=1.5, fl='test.dat'):
+def allHyst(js, T, di = .01, i0 = 0, imax=1.5, fl='test.dat', workers=1, seed=None, cache=None, fmt='dat', progress=None, counters=False, dimin=None, dv=.05, checkpoint=None, queue=None, settle=None):
     """ Produces data file with an hysteric IV curve that is averaged over the junctions
         along with data from each individual junction.
 
@@ -158,58 +506,43 @@ def allHyst(js, T, di = .01, i0 = 0, imax=1.5, fl='test.dat'):
         di: current step
         i0: initial current
         imax: max current
-        fl: data file to write"""
+        fl: data file to write
+        workers: number of processes the junctions are spread over
+        seed: seed for the noise of the junctions (see Parallel.seedAll)
+        cache: Cache.IVCache of earlier results, consulted before running a junction
+        fmt: 'dat' for a text file or 'npy' for binary columns (see Output)
+        progress: callback receiving the progress reports (see Progress.Tracker), None prints them
+        counters: also count the time spent in the integrator, derivative and noise
+        dimin: refine the di grid down to dimin where the voltage jumps, in this process (see adaptive).
+               None keeps the grid uniform
+        dv: voltage jump resolved by the refinement, or that counts as a switch of a continued sweep
+        checkpoint: Checkpoint.Checkpoint or file that the sweep saves its progress to, and resumes from
+        queue: Parallel.WorkQueue or directory that the junctions are put on, so that 
+               other machines can help with the sweep (see Parallel.WorkQueue)
+        settle: continue every point from its neighbours and settle it for settle*T, in this 
+                process (see continuation). The cache then stores whole branches. None runs 
+                every point for the full T"""
     start_time = time.time()
-    nw = datetime.datetime.now()
-    fl = FS.fileSetup(fl)
-    f = open(fl, 'w')
-    # write heading
-    f.write('Hysteric IV Plot with individual junctions\n')
-    f.write('No. of Junctions:    {0} \n'.format(len(js)))
-    f.write('Type of Junctions:  {0} \n'.format(js[0].getType()))
-    f.write('Junctions Info:     {0} \n'.format(js[0].getInfo()))
-    f.write('dt, T:              {0}, {1} \n'.format(js[0].dt, T))
-    f.write('current range, di:  {1}-{2}, {0} \n'.format(di, i0, imax))
-    f.write('Date:               {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year))
-    f.write('Time:               {0}:{1} \n'.format(nw.hour, nw.minute))
+    if seed is not None or workers > 1 or queue is not None:
+        Parallel.seedAll(js, seed)
+    timers = Progress.count(js) if counters else None
+    w = ivWriter('Hysteric IV Plot with individual junctions\n', js, T, di, i0, imax, fl, fmt, True)
+    w, done = resume(w, js, checkpoint, (workers <= 1 and queue is None or settle is not None) and dimin is None)
 
-    i = i0
-    out = 'Current    Voltage \n(i)        (v) \n'
-    while (i < imax):
-        out = ''.join([out, '{0:.5f}'.format(i)])
-        vs = []
-        sumv = 0.0
-        vtot = 0
-        for j in js:
-            v = j.applyI(i, T)
-            vs.append(v)
-            sumv += v
-            vtot += 1
-        out = ''.join([out, '    {0:+.8f} \n'.format(sumv/vtot)])
-        for v_ in vs:
-            out = ''.join([out, '    {0:+.8f}'.format(v_)])
-        out = ''.join([out, '\n'])
-        print('{0} run for {1} seconds'.format(i, time.time() - start_time))
-        i += di
-    i = imax
-    print('Lowering current')
-    while (i > i0):
-        out = ''.join([out, '{0:.5f}'.format(i)])
-        vs = []
-        sumv = 0.0
-        vtot = 0
-        for j in js:
-            v = j.applyI(i, T)
-            vs.append(v)
-            sumv += v
-            vtot += 1
-        out = ''.join([out, '    {0:+.8f} \n'.format(sumv/vtot)])
-        for v_ in vs:
-            out = ''.join([out, '    {0:+.8f}'.format(v_)])
-        out = ''.join([out, '\n'])
-        print('{0} run for {1} seconds'.format(i, time.time() - start_time))
-        i -= di
-    f.write('Runtime:            {0} \n\n'.format(time.time() - start_time))
-    f.write(out)
-    f.close()
-    print('done  {0}'.format(fl))
+    cs = currents(i0, imax, di)
+    ds = currents(imax, i0, -di)
+    track = Progress.Tracker(js, len(cs) + len(ds), progress, timers)
+    track.report('start')
+    if dimin is not None:
+        cs += ds[:1]
+        track.points = 2*len(cs)
+        up, dn = adaptive(js, cs, T, track, dimin, dv, cache, True)
+        pts = [p[:2] for p in up + dn[::-1]]
+    elif settle is not None:
+        pts = continuation(js, cs, ds, T, track, settle, dv, cache, done)
+    else:
+        pts = sweep(js, cs + ds, T, track, False, workers, cache = cache, lower = len(cs), queue = queue, skip = done)
+    for i, vs in pts:
+        w.row([i, sum(vs)/len(vs)] + vs)
+    fl = w.close(time.time() - start_time)
+    track.done(fl, 'done  {0}'.format(fl))
@@ -0,0 +1,170 @@
+import os, json, shutil, struct
+import numpy as np
+import FileSetup as FS
+
+HEADER_LEN = 128 # bytes kept for the .npy header, so that it can be rewritten in place
+
+def npyHeader(rows, cols):
+    """ Returns the .npy header of a float64 array of shape (rows, cols), padded to HEADER_LEN bytes."""
+    magic = np.lib.format.magic(1, 0)
+    n = HEADER_LEN - len(magic) - 2
+    d = "{{'descr': '<f8', 'fortran_order': False, 'shape': ({0}, {1}), }}".format(rows, cols)
+    return magic + struct.pack('<H', n) + d.ljust(n - 1) + '\n'
+
+def headInfo(head):
+    """ Returns a dict of the 'label: value' lines of a heading."""
+    info = {'title': head[0].strip()}
+    for line in head[1:]:
+        label, sep, value = line.partition(':')
+        if sep:
+            info[label.strip()] = value.strip()
+    return info
+
+class DatWriter:
+    """ Writes the rows of a sweep to a .dat text file as they are produced.
+
+        The rows are streamed to a .part file, which is joined to the 
+        heading and runtime when the writer is closed."""
+    def __init__(self, fl, head, colhead, rowfmt):
+        """ Initiates the writer.
+
+            fl: data file to write
+            head: list of the heading lines
+            colhead: column headings written above the rows
+            rowfmt: format string of a row, formatted with the values of the row """
+        self.fl = FS.fileSetup(fl)
+        open(self.fl, 'w').close() # reserves the name until the file is written in close
+        self.head = head
+        self.colhead = colhead
+        self.rowfmt = rowfmt
+        self.part = open(self.fl + '.part', 'w')
+
+    def row(self, values):
+        """ Appends a row of values."""
+        self.part.write(self.rowfmt.format(*values))
+        self.part.flush()
+
+    def rows(self, values):
+        """ Appends every row of the 2-d array values."""
+        fmt = self.rowfmt.format
+        self.part.write(''.join([fmt(*r) for r in values.tolist()]))
+        self.part.flush()
+
+    def text(self, s):
+        """ Appends the text s between rows."""
+        self.part.write(s)
+
+    def close(self, runtime):
+        """ Writes the data file and returns its name."""
+        self.part.close()
+        with open(self.fl, 'w') as f:
+            f.write(''.join(self.head))
+            f.write('Runtime:            {0} \n\n'.format(runtime))
+            f.write(self.colhead)
+            with open(self.fl + '.part') as part:
+                shutil.copyfileobj(part, f)
+        os.remove(self.fl + '.part')
+        return self.fl
+
+class NpyWriter:
+    """ Writes the rows of a sweep to a .npy file of float64 columns as they are produced.
+
+        The heading goes to a .json file of the same name. The .npy header 
+        is rewritten with the number of rows when the writer is closed, and
+        load reads the rows of unfinished files too."""
+    def __init__(self, fl, head, colhead, rowfmt, columns):
+        """ Initiates the writer.
+
+            fl: data file to write (the extension is replaced by .npy)
+            head: list of the heading lines
+            colhead: column headings of the text format
+            rowfmt: format string of a row in the text format
+            columns: list of the names of the columns """
+        self.fl = FS.fileSetup(os.path.splitext(fl)[0] + '.npy')
+        self.meta = headInfo(head)
+        self.meta.update({'head': head, 'colhead': colhead, 'rowfmt': rowfmt, 
+                          'columns': columns, 'text': [], 'rows': 0})
+        self.f = open(self.fl, 'wb')
+        self.f.write(npyHeader(0, len(columns)))
+        self.writeMeta()
+
+    def writeMeta(self):
+        """ Writes the .json file with the heading."""
+        with open(os.path.splitext(self.fl)[0] + '.json', 'w') as f:
+            json.dump(self.meta, f, indent=1)
+
+    def row(self, values):
+        """ Appends a row of values."""
+        if len(values) != len(self.meta['columns']):
+            raise Exception('Row needs {0} values'.format(len(self.meta['columns'])))
+        self.f.write(np.asarray(values, dtype='<f8').tostring())
+        self.f.flush()
+        self.meta['rows'] += 1
+
+    def rows(self, values):
+        """ Appends every row of the 2-d array values."""
+        values = np.asarray(values, dtype='<f8')
+        if values.shape[1] != len(self.meta['columns']):
+            raise Exception('Row needs {0} values'.format(len(self.meta['columns'])))
+        self.f.write(values.tostring())
+        self.f.flush()
+        self.meta['rows'] += len(values)
+
+    def text(self, s):
+        """ Records the text s between rows, for the text exporter."""
+        self.meta['text'].append([self.meta['rows'], s])
+
+    def close(self, runtime):
+        """ Finishes the data file and returns its name."""
+        self.meta['Runtime'] = runtime
+        self.f.seek(0)
+        self.f.write(npyHeader(self.meta['rows'], len(self.meta['columns'])))
+        self.f.close()
+        self.writeMeta()
+        return self.fl
+
+def writer(fl, head, colhead, rowfmt, columns, fmt = 'dat'):
+    """ Returns a writer for the rows of a sweep.
+
+        fl: data file to write
+        head: list of the heading lines
+        colhead: column headings of the text format
+        rowfmt: format string of a row in the text format
+        columns: list of the names of the columns
+        fmt: 'dat' for the text format or 'npy' for binary columns """
+    if fmt == 'dat':
+        return DatWriter(fl, head, colhead, rowfmt)
+    if fmt == 'npy':
+        return NpyWriter(fl, head, colhead, rowfmt, columns)
+    raise Exception('Unknown output format {0}'.format(fmt))
+
+def load(fl):
+    """ Loads a file written by NpyWriter without copying the data.
+        Returns the memory mapped array of rows and the dict of the heading."""
+    root = os.path.splitext(fl)[0]
+    with open(root + '.json') as f:
+        meta = json.load(f)
+    cols = len(meta['columns'])
+    rows = (os.path.getsize(root + '.npy') - HEADER_LEN)//(8*cols)
+    if rows == 0:
+        return np.empty((0, cols)), meta
+    return np.memmap(root + '.npy', dtype='<f8', mode='r', offset=HEADER_LEN, shape=(rows, cols)), meta
+
+def toDat(fl, datfl = None):
+    """ Exports a file written by NpyWriter to the .dat text format. 
+        Returns the name of the written file.
+
+        fl: .npy file to export
+        datfl: text file to write (defaults to fl with a .dat extension)"""
+    data, meta = load(fl)
+    w = DatWriter(datfl or os.path.splitext(fl)[0] + '.dat', meta['head'], meta['colhead'], meta['rowfmt'])
+    texts = meta['text']
+    t = 0
+    for k in xrange(len(data)):
+        while t < len(texts) and texts[t][0] == k:
+            w.text(texts[t][1])
+            t += 1
+        w.row(data[k])
+    for k, s in texts[t:]:
+        w.text(s)
+    return w.close(meta.get('Runtime', ''))
\ No newline at end of file
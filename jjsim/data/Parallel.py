@@ -0,0 +1,218 @@
+import os, random, time, socket, threading, hashlib
+import cPickle as pickle
+import multiprocessing
+
+def streamSeed(seed, k):
+    """ Returns the seed of the k-th independent random stream derived from seed."""
+    return [int(seed) & 0xffffffff, k]
+
+def seedAll(js, seed = None):
+    """ Gives every noisy junction its own random stream derived from seed.
+        The k-th junction always gets the same stream, no matter how the 
+        junctions are later split between processes. 
+
+        js: list of junctions or a JJs.JJEnsemble
+        seed: base seed (None picks a random one)"""
+    if seed is None:
+        seed = random.getrandbits(32)
+    if hasattr(js, 'seed'):
+        js.seed(seed)
+        return
+    for k, j in enumerate(js):
+        if hasattr(j, 'seed'):
+            j.seed(streamSeed(seed, k))
+
+def runTasks(fn, tasks, workers = 1, queue = None):
+    """ Returns the list of fn(task) for every task, computed by a pool of worker processes.
+
+        fn: function run on every task. It must be defined at the top level of a module
+        tasks: list of arguments for fn
+        workers: number of processes (1 runs everything in this process)
+        queue: WorkQueue (or its directory) to put the tasks on, so that other machines 
+               can take some of them (see WorkQueue). The workers of this machine drain it too"""
+    if queue is not None:
+        q = queue if isinstance(queue, WorkQueue) else WorkQueue(queue)
+        names = q.submit(fn, tasks)
+        return q.gather(names, workers)
+    if workers <= 1:
+        return [fn(t) for t in tasks]
+    pool = multiprocessing.Pool(workers)
+    try:
+        return pool.map(fn, tasks, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+def indexed(args):
+    """ Returns the index k of a task and fn(task).
+
+        args: tuple of fn, k and the task"""
+    fn, k, task = args
+    return k, fn(task)
+
+def iterTasks(fn, tasks, workers = 1):
+    """ Yields the index and the result fn(task) of every task as soon as it is done,
+        computed by a pool of worker processes.
+
+        The tasks are handed out one at a time in the order of the list, so the 
+        longest tasks should come first to keep the workers busy to the end.
+
+        fn: function run on every task. It must be defined at the top level of a module
+        tasks: list of arguments for fn
+        workers: number of processes (1 runs everything in this process)"""
+    if workers <= 1:
+        for k, task in enumerate(tasks):
+            yield k, fn(task)
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        for res in pool.imap_unordered(indexed, [(fn, k, task) for k, task in enumerate(tasks)], 1):
+            yield res
+    finally:
+        pool.terminate()
+        pool.join()
+
+def drainQueue(args):
+    """ Drains a WorkQueue. Returns the number of tasks run.
+
+        args: tuple of the directory of the queue and its stale time"""
+    path, stale = args
+    return WorkQueue(path, stale).drain()
+
+class WorkQueue:
+    """ A queue of tasks kept as files in a directory, so that processes on several 
+        machines sharing the filesystem can work through it together.
+
+        A task is a pickled function and its argument in todo/. A process claims it by 
+        renaming it into claimed/, which only one process can do, and keeps touching 
+        the claimed file while it runs. The result goes to done/ and the claim is removed.
+        Claims not touched for stale seconds are put back into todo/, so the tasks of a 
+        machine that died are run again. A task is named after its position and the hash 
+        of its pickle, so tasks of other sweeps never take its result. Done tasks are never 
+        run again, so a sweep that is restarted with the same queue (and seed) only runs 
+        what is left of it.
+
+        To help with a queue from another machine run
+            python -c "from jjsim.data import Parallel; Parallel.WorkQueue('path').drain()" """
+    def __init__(self, path, stale = 300, poll = 5):
+        """ Initiates the queue, creating its directories if needed.
+
+            path: directory of the queue, on the shared filesystem
+            stale: seconds after which a claim that is not touched is taken as dead
+            poll: seconds between looks at the queue while waiting for other machines"""
+        self.path = path
+        self.stale = stale
+        self.poll = poll
+        for d in ('todo', 'claimed', 'done'):
+            if not os.path.exists(os.path.join(path, d)):
+                try:
+                    os.makedirs(os.path.join(path, d))
+                except OSError:
+                    pass # made by another process in the meantime
+
+    def file(self, where, name):
+        """ Returns the file of task name in the directory where."""
+        return os.path.join(self.path, where, name + '.pkl')
+
+    def write(self, fl, obj):
+        """ Pickles obj to the file fl, which appears complete or not at all."""
+        tmp = '{0}.{1}.{2}.tmp'.format(fl, socket.gethostname(), os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, fl)
+
+    def name(self, k, fn, task):
+        """ Returns the name of the k-th task fn(task): its position, so the tasks are 
+            claimed in order, and the hash of its pickle."""
+        return '{0:06d}-{1}'.format(k, hashlib.sha1(pickle.dumps((fn, task), pickle.HIGHEST_PROTOCOL)).hexdigest())
+
+    def submit(self, fn, tasks):
+        """ Puts fn(task) for every task on the queue, unless it is already there or done.
+            Returns the list of the names of the tasks."""
+        names = [self.name(k, fn, task) for k, task in enumerate(tasks)]
+        for name, task in zip(names, tasks):
+            if not any(os.path.exists(self.file(d, name)) for d in ('todo', 'claimed', 'done')):
+                self.write(self.file('todo', name), (fn, task))
+        return names
+
+    def claim(self):
+        """ Claims a task. Returns its name, or None if there is nothing to do."""
+        for fl in sorted(os.listdir(os.path.join(self.path, 'todo'))):
+            name, ext = os.path.splitext(fl)
+            if ext != '.pkl':
+                continue
+            try:
+                os.rename(self.file('todo', name), self.file('claimed', name))
+            except OSError:
+                continue # claimed by someone else first
+            os.utime(self.file('claimed', name), None)
+            return name
+        return None
+
+    def run(self, name):
+        """ Runs the claimed task name and stores its result, touching the claim while it runs."""
+        fl = self.file('claimed', name)
+        with open(fl, 'rb') as f:
+            fn, task = pickle.load(f)
+        stop = threading.Event()
+        def beat():
+            while not stop.wait(self.stale/4.0):
+                try:
+                    os.utime(fl, None)
+                except OSError:
+                    return
+        t = threading.Thread(target = beat)
+        t.daemon = True
+        t.start()
+        try:
+            res = fn(task)
+        finally:
+            stop.set()
+        self.write(self.file('done', name), res)
+        try:
+            os.remove(fl)
+        except OSError:
+            pass # requeued meanwhile, and maybe done twice
+
+    def requeue(self):
+        """ Puts the claims that have not been touched for self.stale seconds back on the queue."""
+        now = time.time()
+        for fl in os.listdir(os.path.join(self.path, 'claimed')):
+            name, ext = os.path.splitext(fl)
+            if ext != '.pkl' or os.path.exists(self.file('done', name)):
+                continue
+            try:
+                if now - os.path.getmtime(self.file('claimed', name)) > self.stale:
+                    os.rename(self.file('claimed', name), self.file('todo', name))
+            except OSError:
+                pass
+
+    def drain(self):
+        """ Runs tasks until there are none left to claim. Returns the number of tasks run."""
+        n = 0
+        name = self.claim()
+        while name is not None:
+            self.run(name)
+            n += 1
+            name = self.claim()
+        return n
+
+    def gather(self, names, workers = 1):
+        """ Helps drain the queue and waits for the tasks names to be done.
+            Returns the list of their results.
+
+            workers: number of processes of this machine that drain the queue"""
+        while True:
+            if workers > 1:
+                runTasks(drainQueue, [(self.path, self.stale)]*workers, workers)
+            else:
+                self.drain()
+            if all(os.path.exists(self.file('done', name)) for name in names):
+                break
+            self.requeue()
+            time.sleep(self.poll)
+        res = []
+        for name in names:
+            with open(self.file('done', name), 'rb') as f:
+                res.append(pickle.load(f))
+        return res
\ No newline at end of file
@@ -1,80 +1,136 @@
 import math
+import numpy as np
 from jjsim import JJs
-import FileSetup as FS
+import Parallel
+import Output
+import Progress
 import time, datetime
 
-def phasePorts(js, i = 0.0, T = 1000, mod = 100000, fl='test.dat'):
+def steps(T, dt):
+    """ Returns the number of timesteps t with t*dt < T."""
+    n = int(T/dt)
+    while n*dt < T:
+        n += 1
+    while n > 0 and (n - 1)*dt >= T:
+        n -= 1
+    return n
+
+def record(j, i = 0.0, T = 1000, mod = 1, phase = 'unwrap', ring = None, pmax = None):
+    """ Records the trajectory of a junction under bias current i for duration T.
+        Returns an array with a (t, p, v) row for every mod-th timestep.
+
+        The junction is advanced mod steps at a time between the recorded points
+        and the points go into an array allocated up front. 
+
+        j: junction
+        i: bias current
+        T: duration of the trajectory
+        mod: number of timesteps between recorded points
+        phase: 'unwrap' records the phase as integrated, 'wrap' maps it into [-pi, pi)
+        ring: only keep the last ring points (None keeps all of them)
+        pmax: stop once the phase exceeds pmax (None runs for all of T)"""
+    j.i = i
+    n = (steps(T, j.dt) + mod - 1)//mod
+    pts = np.empty((min(n, ring) if ring else n, 3))
+    m = len(pts)
+    k = 0
+    j.steps = 0
+    start = time.time()
+    while k < n:
+        j.advance(mod if k else 1, j.integrator)
+        j.steps += mod if k else 1
+        p = j.phase
+        pts[k % m] = (k*mod*j.dt, p if phase == 'unwrap' else (p + math.pi) % (2*math.pi) - math.pi, j.volt)
+        k += 1
+        if pmax is not None and p > pmax:
+            break
+    if j.timers is not None:
+        j.timers.add('integrator', time.time() - start)
+    if k > m:
+        return np.roll(pts, -(k % m), axis=0)
+    return pts[:k]
+
+def portrait(args):
+    """ Runs the phase portrait of one junction. 
+        Returns the junction, the array of (t, p, v) points of its portrait and the seconds it took.
+
+        args: tuple of the junction and the arguments of record after it"""
+    j = args[0]
+    start = time.time()
+    pts = record(*args)
+    return j, pts, time.time() - start
+
+def portWriter(js, i, T, fl, fmt, colhead, rowfmt):
+    """ Returns an Output writer with the heading of a phase portrait.
+        Its rows are the junction number, t, p and v."""
+    nw = datetime.datetime.now()
+    head = ['Phase Portrait \n',
+            'No. of Junction:    {0} \n'.format(len(js)),
+            'Type of Junctions:  {0} \n'.format(js[0].getType()),
+            'Junctions Info:     {0} \n'.format(js[0].getInfo()),
+            'dt, T:              {0}, {1} \n'.format(js[0].dt, T),
+            'i:                  {0} \n'.format(i),
+            'Date:               {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year),
+            'Time:               {0}:{1} \n'.format(nw.hour, nw.minute)]
+    return Output.writer(fl, head, colhead, rowfmt, ['junction', 't', 'p', 'v'], fmt)
+
+def phasePorts(js, i = 0.0, T = 1000, mod = 100000, fl='test.dat', workers=1, seed=None, fmt='dat', phase='unwrap', ring=None, pmax=None, progress=None, counters=False):
     """ Returns the phase portraits for the junctions.
 
         js: array of junctions
         i: bias current
         dt: timestep
         T: duration of junction averaging
-        fl: data file to write """ 
+        fl: data file to write 
+        phase, ring, pmax: how the points are recorded (see record)
+        workers: number of processes the junctions are spread over
+        seed: seed for the noise of the junctions (see Parallel.seedAll)
+        fmt: 'dat' for a text file or 'npy' for binary columns (see Output)
+        progress: callback receiving the progress reports, one point per junction (see Progress.Tracker)
+        counters: also count the time spent in the integrator, derivative and noise""" 
     start_time = time.time()
-    nw = datetime.datetime.now()
-    fl = FS.fileSetup(fl)
-    f = open(fl, 'w')
-    # write heading
-    f.write('Phase Portrait \n')
-    f.write('No. of Junction:    {0} \n'.format(len(js)))
-    f.write('Type of Junctions:  {0} \n'.format(js[0].getType()))
-    f.write('Junctions Info:     {0} \n'.format(js[0].getInfo()))
-    f.write('dt, T:              {0}, {1} \n'.format(js[0].dt, T))
-    f.write('i:                  {0} \n'.format(i))
-    f.write('Date:               {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year))
-    f.write('Time:               {0}:{1} \n'.format(nw.hour, nw.minute))
+    if seed is not None or workers > 1:
+        Parallel.seedAll(js, seed)
+    timers = Progress.count(js) if counters else None
+    w = portWriter(js, i, T, fl, fmt, 'Time   Phase       Voltage \n(t)    (p)         (v) \n', 
+                   '{1:.3f}  {2:.8f}  {3:.8f} \n')
 
-    out = 'Time   Phase       Voltage \n(t)    (p)         (v) \n'
-    print('starting')
-    for j in js:
-        t = 0
-        while t*j.dt<T:
-            pv = j.getPhaseVolt(i)
-            if t%mod == 0:
-                out += '{0:.3f}  {1:.8f}  {2:.8f} \n'.format(t*j.dt, pv[0], pv[1])
-            if pv[0] > 50:
-                break
-            t+=1
-        out += '\n'
-    f.write('Runtime:            {0} \n\n'.format(time.time() - start_time))
-    f.write(out)
-    f.close()
-    print('done {0}'.format(fl))
+    track = Progress.Tracker(js, len(js), progress, timers, None)
+    track.report('start', 'starting')
+    res = Parallel.runTasks(portrait, [(j, i, T, mod, phase, ring, pmax) for j in js], workers)
+    if counters and workers > 1:
+        for j, r in zip(js, res):
+            j.timers = r[0].timers
+        track.timers = Progress.gather(js)
+    for k, (j, r) in enumerate(zip(js, res)):
+        j.__dict__.update(r[0].__dict__)
+        for pt in r[1]:
+            w.row([k, pt[0], pt[1], pt[2]])
+        w.text('\n')
+        track.point(i, j.steps, r[2])
+    fl = w.close(time.time() - start_time)
+    track.done(fl, 'done {0}'.format(fl))
 
-def phasePort(j, i = 0.0, T = 1000, mod = 100000, fl='test.dat'):
+def phasePort(j, i = 0.0, T = 1000, mod = 100000, fl='test.dat', fmt='dat', phase='unwrap', ring=None, pmax=None, progress=None, counters=False):
     """ Returns the phase portraits for a junction.
 
         j: junctions
         i: bias current
         dt: timestep
         T: duration of junction averaging
-        fl: data file to write """ 
+        fl: data file to write 
+        phase, ring, pmax: how the points are recorded (see record)
+        fmt: 'dat' for a text file or 'npy' for binary columns (see Output)
+        progress: callback receiving the progress reports, one point per junction (see Progress.Tracker)
+        counters: also count the time spent in the integrator, derivative and noise""" 
     start_time = time.time()
-    nw = datetime.datetime.now()
-    fl = FS.fileSetup(fl)
-    f = open(fl, 'w')
-    # write heading
-    f.write('Phase Portrait \n')
-    f.write('No. of Junction:    {0} \n'.format(len(js)))
-    f.write('Type of Junctions:  {0} \n'.format(js[0].getType()))
-    f.write('Junctions Info:     {0} \n'.format(js[0].getInfo()))
-    f.write('dt, T:              {0}, {1} \n'.format(js[0].dt, T))
-    f.write('i:                  {0} \n'.format(i))
-    f.write('Date:               {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year))
-    f.write('Time:               {0}:{1} \n'.format(nw.hour, nw.minute))
+    w = portWriter([j], i, T, fl, fmt, 'Time    Phase    Voltage \n(t)    (p)    (v) \n', 
+                   '{1:.3f}    {2:.8f}    {3:.8f} \n')
 
-    out = 'Time    Phase    Voltage \n(t)    (p)    (v) \n'
-    print('starting')
-    t = 0
-    while t*j.dt<T:
-        pv = j.getPhaseVolt(i)
-        if t%mod == 0:
-            out += '{0:.3f}    {1:.8f}    {2:.8f} \n'.format(t*j.dt, pv[0], pv[1])
-        if pv[0] > 50:
-            break
-        t+=1
-    f.write('Runtime:            {0} \n\n'.format(time.time() - start_time))
-    f.write(out)
-    f.close()
-    print('done {0}'.format(fl))
\ No newline at end of file
+    track = Progress.Tracker([j], 1, progress, Progress.count([j]) if counters else None, None)
+    track.report('start', 'starting')
+    for pt in record(j, i, T, mod, phase, ring, pmax):
+        w.row([0, pt[0], pt[1], pt[2]])
+    track.point(i)
+    fl = w.close(time.time() - start_time)
+    track.done(fl, 'done {0}'.format(fl))
\ No newline at end of file
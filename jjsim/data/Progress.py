@@ -0,0 +1,107 @@
+from jjsim import JJs
+from jjsim import Stats
+import time
+
+def printProgress(info):
+    """ Default progress callback of the sweeps. Prints the message of every event that has one.
+
+        info: dictionary describing the event (see Tracker)"""
+    if info['message'] is not None:
+        print(info['message'])
+
+def count(js):
+    """ Starts counting the time the junctions spend in the integrator, the derivative and the noise.
+        Returns the Stats.Timers shared by the junctions.
+
+        js: list of junctions or a JJs.JJEnsemble"""
+    timers = Stats.Timers()
+    if isinstance(js, JJs.JJEnsemble):
+        js.timers = timers
+    for j in (js.js if isinstance(js, JJs.JJEnsemble) else js):
+        j.timers = timers
+    return timers
+
+def gather(js):
+    """ Returns the Stats.Timers of the junctions added together.
+        Junctions that come back from worker processes each hold their own copy of the timers."""
+    timers = Stats.Timers()
+    seen = set()
+    for j in js:
+        if j.timers is not None and id(j.timers) not in seen:
+            seen.add(id(j.timers))
+            timers.merge(j.timers)
+    return timers
+
+def work(js):
+    """ Returns the number of timesteps the junctions ran for their last bias point and
+        the list of whether each junction with a tolerance converged (None if none has one).
+
+        js: list of junctions or a JJs.JJEnsemble"""
+    if isinstance(js, JJs.JJEnsemble):
+        return js.steps, None
+    steps = sum(j.steps for j in js)
+    conv = [getattr(j, 'converged', None) for j in js if getattr(j, 'tol', None) is not None]
+    return steps, conv or None
+
+class Tracker:
+    """ Reports the progress of a sweep to a callback.
+
+        Every report is a dictionary with at least
+            event: 'start', 'point', 'lower' (a hysteresis sweep starts lowering the current) or 'done'
+            message: the line printProgress prints, or None
+            elapsed: seconds since the sweep started
+        'point' reports also have
+            i: bias current
+            point, points: number of the point and number of points of the sweep
+            seconds: time spent on the point
+            steps, steps_per_sec: timesteps run for the point, over all junctions
+            converged: whether each junction with a tolerance converged, or None
+            counters: {name: (seconds, calls)} of the integrator, derivative and noise
+                      so far, or None if they are not counted (see count)
+        and 'done' reports have file, the data file written."""
+    def __init__(self, js, points = 0, progress = None, timers = None, msg = '{0} run for {1} seconds'):
+        """ Initiates the tracker of a sweep.
+
+            js: junctions of the sweep
+            points: number of points of the sweep
+            progress: callback taking the report dictionary (None uses printProgress)
+            timers: Stats.Timers of the junctions (see count), or None
+            msg: message of a point, formatted with the current and the elapsed time (None for no message)"""
+        self.js = js
+        self.points = points
+        self.progress = progress or printProgress
+        self.timers = timers
+        self.msg = msg
+        self.start = time.time()
+        self.last = self.start
+        self.k = 0
+
+    def report(self, event, message = None, **info):
+        """ Hands a report of event to the callback."""
+        info['event'] = event
+        info['message'] = message
+        info['elapsed'] = time.time() - self.start
+        self.progress(info)
+
+    def point(self, i, steps = None, secs = None, converged = None):
+        """ Reports a finished bias point.
+            Without steps, the steps and convergence are read from the junctions and
+            without secs the time since the last point is used."""
+        now = time.time()
+        if secs is None:
+            secs = now - self.last
+        self.last = now
+        if steps is None:
+            steps, converged = work(self.js)
+        self.k += 1
+        counters = None
+        if self.timers is not None:
+            counters = dict((name, (self.timers.times[name], self.timers.calls[name])) for name in self.timers.times)
+        self.report('point', self.msg.format(i, now - self.start) if self.msg else None,
+                    i = i, point = self.k, points = self.points, seconds = secs, steps = steps,
+                    steps_per_sec = steps/secs if secs > 0 else float('inf'),
+                    converged = converged, counters = counters)
+
+    def done(self, fl, message):
+        """ Reports the end of the sweep, written to the data file fl."""
+        self.report('done', message, file = fl)
\ No newline at end of file
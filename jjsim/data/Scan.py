@@ -0,0 +1,140 @@
+import os, json, random, itertools
+import numpy as np
+import FileSetup as FS
+import Parallel
+import Output
+import Progress
+import IVPlot
+import time, datetime
+
+def points(axes):
+    """ Returns the list of the (index, parameters) of every point of the grid of axes,
+        in the order of the grid.
+
+        axes: list of the (name, values) of every axis"""
+    names = [name for name, values in axes]
+    ranges = [xrange(len(values)) for name, values in axes]
+    return [(k, dict(zip(names, [values[n] for (name, values), n in zip(axes, k)])))
+            for k in itertools.product(*ranges)]
+
+def cost(j, n, T):
+    """ Returns the estimated cost of sweeping junction j over n currents for duration T:
+        its number of timesteps, weighted by the number of variables of its diff eq
+        and doubled for noise."""
+    return n*int(T/j.dt)*len(j.getState())*(2 if j.getTemp() != 0 else 1)
+
+def scanTask(args):
+    """ Runs the sweep of one point of a scan.
+        Returns the list of the voltages of every branch, the number of timesteps and the seconds it took.
+
+        args: tuple of the junction, the list of currents, whether to lower the current
+              back through them afterwards and T"""
+    j, cs, down, T = args
+    start = time.time()
+    j, vs, work = IVPlot.sweepJunction((j, cs, T, None))
+    out = [vs]
+    if down:
+        j, ds, more = IVPlot.sweepJunction((j, cs[::-1], T, None))
+        out.append(ds[::-1])
+        work += more
+    return out, sum(w[0] for w in work), time.time() - start
+
+def writeMeta(fl, meta):
+    """ Writes the .json file with the heading of the data file fl."""
+    with open(os.path.splitext(fl)[0] + '.json', 'w') as f:
+        json.dump(meta, f, indent=1)
+
+def load(fl):
+    """ Loads a file written by scan without copying the data.
+        Returns the memory mapped array of the voltages and the dict of the heading,
+        with the axes and the currents."""
+    root = os.path.splitext(fl)[0]
+    with open(root + '.json') as f:
+        meta = json.load(f)
+    return np.load(root + '.npy', mmap_mode='r'), meta
+
+def scan(make, axes, T = 1000, di = .01, i0 = 0.0, imax = 1.5, fl='scan.npy', hyst=False, workers=1, seed=None, fixed=None, costs=None, progress=None, queue=None):
+    """ Produces one data file with the IV curves over every point of a grid of junction
+        parameters, instead of a file for each of them.
+
+        Every point of the grid is a junction made by make and swept over the currents,
+        which is the unit of work handed to the processes. The units are run in order
+        of their estimated cost, the most expensive first, so that no process is left
+        with a long unit at the end.
+
+        The data file is a .npy array of the average voltages, indexed by the axes
+        in their order, then the branch (raising and lowering the current, with hyst only),
+        then the current. The voltages are written as the units finish, and points that are
+        not done yet are nan. The heading, the axes and the currents go to a .json file of
+        the same name (see load).
+
+        make: function (or junction class) that returns the junction for the keyword arguments
+              of a point, for example JJs.JJnFreq
+        axes: list of the (name, values) of every axis, e.g. [('b_c', [1, 2]), ('temp', [0, .01])]
+        T: duration of junction averaging
+        di: current step
+        i0: initial current
+        imax: max current
+        fl: data file to write (the extension is replaced by .npy)
+        hyst: also lower the current back through the currents, as a second branch
+        workers: number of processes the points are spread over
+        seed: seed for the noise of the junctions. The junction of every point gets its own
+              stream, so the data does not depend on the workers or the order
+        fixed: dict of further keyword arguments of make, the same for every point
+        costs: function returning the cost of the junction of a point, in place of cost
+        progress: callback receiving the progress reports, one point per unit with the
+                  parameters of the unit as i (see Progress.Tracker)
+        queue: Parallel.WorkQueue or directory that the units are put on, so that
+               other machines can help with the scan (see Parallel.WorkQueue)"""
+    start_time = time.time()
+    cs = IVPlot.currents(i0, imax, di)
+    pts = points(axes)
+    if seed is None:
+        seed = random.getrandbits(32)
+    js = []
+    for n, (k, params) in enumerate(pts):
+        kw = dict(fixed or {})
+        kw.update(params)
+        j = make(**kw)
+        if hasattr(j, 'seed'):
+            j.seed(Parallel.streamSeed(seed, n))
+        js.append(j)
+    est = [costs(j) if costs is not None else cost(j, len(cs)*(2 if hyst else 1), T) for j in js]
+    order = sorted(xrange(len(js)), key = lambda n: -est[n])
+
+    shape = tuple(len(values) for name, values in axes) + ((2,) if hyst else ()) + (len(cs),)
+    fl = FS.fileSetup(os.path.splitext(fl)[0] + '.npy')
+    data = np.lib.format.open_memmap(fl, mode='w+', dtype='<f8', shape=shape)
+    data.fill(np.nan)
+    nw = datetime.datetime.now()
+    head = ['Parameter Scan \n',
+            'No. of Points:      {0} \n'.format(len(pts)),
+            'Type of Junctions:  {0} \n'.format(js[0].getType()),
+            'Axes:               {0} \n'.format(', '.join(name for name, values in axes)),
+            'dt, T:              {0}, {1} \n'.format(js[0].dt, T),
+            'current range, di:  {1}-{2}, {0} \n'.format(di, i0, imax),
+            'Date:               {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year),
+            'Time:               {0}:{1} \n'.format(nw.hour, nw.minute)]
+    meta = Output.headInfo(head)
+    meta.update({'head': head, 'axes': [[name, list(values)] for name, values in axes],
+                 'fixed': fixed or {}, 'branches': ['up', 'down'] if hyst else ['up'],
+                 'currents': cs, 'seed': seed, 'shape': list(shape)})
+    writeMeta(fl, meta)
+
+    track = Progress.Tracker([], len(pts), progress, None)
+    track.report('start', 'starting')
+    tasks = [(js[n], cs, hyst, T) for n in order]
+    if queue is not None:
+        res = enumerate(Parallel.runTasks(scanTask, tasks, workers, queue))
+    else:
+        res = Parallel.iterTasks(scanTask, tasks, workers)
+    for m, (vs, steps, secs) in res:
+        k, params = pts[order[m]]
+        data[k] = vs if hyst else vs[0]
+        track.point(', '.join('{0} = {1}'.format(name, params[name]) for name, values in axes), steps, secs)
+    data.flush()
+    del data
+    meta['Runtime'] = time.time() - start_time
+    writeMeta(fl, meta)
+    track.done(fl, 'done with {0}'.format(fl))
+    return fl
\ No newline at end of file
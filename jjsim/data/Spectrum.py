@@ -0,0 +1,178 @@
+import numpy as np
+from jjsim import Stats
+import Parallel
+import Output
+import Progress
+import time, datetime
+
+CHUNK = 4096 # number of samples handed to the Welch estimates at once
+
+class Spectrum:
+    """ Running power spectra of the voltage and of the phase slip rate of a junction,
+        fed while it runs instead of from a stored trajectory (see Stats.Welch).
+
+        The samples are the voltage and the phase slip rate averaged over blocks
+        of mod timesteps, so the spectra go up to a frequency of 1/(2*mod*dt).
+        A junction given the spectrum in applyI feeds it the averaging part of
+        the run. Any other loop can feed it a timestep at a time with add,
+        for example with the phase and voltage from getPhaseVolt."""
+    def __init__(self, dt, nfft = 1024, mod = 1, overlap = .5):
+        """ Initiates empty spectra.
+
+            dt: timestep of the junction
+            nfft: number of samples of a Welch segment
+            mod: number of timesteps averaged into a sample
+            overlap: fraction of a segment shared with the next one """
+        self.dt = float(dt)
+        self.mod = mod
+        self.v = Stats.Welch(nfft, mod*self.dt, overlap)
+        self.slip = Stats.Welch(nfft, mod*self.dt, overlap)
+        self.vs = []
+        self.ss = []
+        self.cut()
+
+    def cut(self):
+        """ Starts a new stretch of samples, e.g. after the junction ran without feeding the spectra."""
+        self.flush()
+        self.v.cut()
+        self.slip.cut()
+        self.p0 = None
+        self.sumv = 0.0
+        self.k = 0
+
+    def reset(self):
+        """ Forgets every sample added so far."""
+        self.v.reset()
+        self.slip.reset()
+        self.vs = []
+        self.ss = []
+        self.cut()
+
+    def flush(self):
+        """ Hands the samples collected so far to the Welch estimates."""
+        if self.vs:
+            self.v.add(self.vs)
+            self.slip.add(self.ss)
+            self.vs = []
+            self.ss = []
+
+    def sample(self, v, s):
+        """ Adds a sample of the voltage v and the phase slip rate s."""
+        self.vs.append(v)
+        self.ss.append(s)
+        if len(self.vs) == CHUNK:
+            self.flush()
+
+    def add(self, v, p):
+        """ Adds a timestep of the junction, with the voltage v and the (unwrapped) phase p
+            after the step. The first timestep of a stretch only sets the phase the slips
+            are counted from. v and p can also be arrays, e.g. from JJs.JJEnsemble.getPhaseVolt."""
+        if self.p0 is None:
+            self.p0 = np.copy(p)
+            return
+        self.sumv = self.sumv + v
+        self.k += 1
+        if self.k == self.mod:
+            self.sample(self.sumv/self.mod, (p - self.p0)/(self.mod*self.dt))
+            self.p0 = np.copy(p)
+            self.sumv = 0.0
+            self.k = 0
+
+    def run(self, j, n, integrator = 'euler'):
+        """ Advances junction j n timesteps like j.advance, feeding the spectra every mod steps.
+            Returns the sum of the voltage over the steps. The samples continue the present
+            stretch, so call cut first if the junction ran without feeding the spectra."""
+        m = self.mod
+        sumv = 0.0
+        p = j.phase
+        for k in xrange(n//m):
+            s = j.advance(m, integrator)
+            sumv += s
+            self.sample(s/m, (j.phase - p)/(m*self.dt))
+            p = j.phase
+        if n % m:
+            sumv += j.advance(n % m, integrator)
+        return sumv
+
+    def freqs(self):
+        """ Returns the frequencies of the spectra."""
+        return self.v.freqs()
+
+    def psd(self):
+        """ Returns the power spectral densities of the voltage and of the phase slip rate."""
+        self.flush()
+        return self.v.psd(), self.slip.psd()
+
+def measure(j, i = 0.0, T = 1000, nfft = 1024, mod = 1, overlap = .5):
+    """ Applies bias current i to junction j for duration T (see applyI) and takes
+        the spectra of the averaging part of the run (see Spectrum).
+        Returns the average voltage, the frequencies and the power spectral densities
+        of the voltage and of the phase slip rate.
+
+        j: junction or junction array
+        nfft, mod, overlap: how the spectra are taken (see Spectrum)"""
+    spec = Spectrum(j.dt, nfft, mod, overlap)
+    v = j.applyI(i, T, spectrum = spec)
+    pv, ps = spec.psd()
+    return v, spec.freqs(), pv, ps
+
+def spectrumTask(args):
+    """ Takes the spectra of one junction.
+        Returns the junction, the result of measure and the seconds it took.
+
+        args: tuple of the junction and the arguments of measure after it"""
+    start = time.time()
+    res = measure(*args)
+    return args[0], res, time.time() - start
+
+def spectra(js, i = 0.0, T = 1000, nfft = 1024, mod = 1, overlap = .5, fl='test.dat', workers=1, seed=None, fmt='dat', progress=None, counters=False):
+    """ Produces data file with the spectra of the voltage and of the phase slip rate of
+        the junctions under bias current i, one block of rows for every junction.
+
+        js: list of junctions
+        i: bias current
+        T: duration of junction averaging
+        nfft: number of samples of a Welch segment
+        mod: number of timesteps averaged into a sample
+        overlap: fraction of a segment shared with the next one
+        fl: data file to write
+        workers: number of processes the junctions are spread over
+        seed: seed for the noise of the junctions (see Parallel.seedAll)
+        fmt: 'dat' for a text file or 'npy' for binary columns (see Output)
+        progress: callback receiving the progress reports, one point per junction (see Progress.Tracker)
+        counters: also count the time spent in the integrator, derivative and noise"""
+    start_time = time.time()
+    if seed is not None or workers > 1:
+        Parallel.seedAll(js, seed)
+    timers = Progress.count(js) if counters else None
+    nw = datetime.datetime.now()
+    head = ['Voltage Spectrum \n',
+            'No. of Junctions:   {0} \n'.format(len(js)),
+            'Type of Junctions:  {0} \n'.format(js[0].getType()),
+            'Junctions Info:     {0} \n'.format(js[0].getInfo()),
+            'dt, T:              {0}, {1} \n'.format(js[0].dt, T),
+            'i:                  {0} \n'.format(i),
+            'nfft, mod, overlap: {0}, {1}, {2} \n'.format(nfft, mod, overlap),
+            'Date:               {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year),
+            'Time:               {0}:{1} \n'.format(nw.hour, nw.minute)]
+    colhead = 'Frequency     Voltage PSD       Slip rate PSD \n(f)           (Sv)              (Ss) \n'
+    rowfmt = '{1:.8f}    {2:.8e}    {3:.8e} \n'
+    w = Output.writer(fl, head, colhead, rowfmt, ['junction', 'f', 'Sv', 'Ss'], fmt)
+
+    track = Progress.Tracker(js, len(js), progress, timers, None)
+    track.report('start', 'starting')
+    res = Parallel.runTasks(spectrumTask, [(j, i, T, nfft, mod, overlap) for j in js], workers)
+    if counters and workers > 1:
+        for j, r in zip(js, res):
+            j.timers = r[0].timers
+        track.timers = Progress.gather(js)
+    for k, (j, r) in enumerate(zip(js, res)):
+        j.__dict__.update(r[0].__dict__)
+        v, f, pv, ps = r[1]
+        w.text('# junction {0}: v = {1:+.8f} \n'.format(k, v))
+        for n in xrange(len(f)):
+            w.row([k, f[n], pv[n], ps[n]])
+        w.text('\n')
+        track.point(i, j.steps, r[2])
+    fl = w.close(time.time() - start_time)
+    track.done(fl, 'done {0}'.format(fl))
\ No newline at end of file
@@ -0,0 +1,253 @@
+import math
+import multiprocessing
+import numpy as np
+from jjsim.DiffSolver import factorize
+import Parallel
+import time, traceback
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    sparse = None
+
+def shared(*shape):
+    """ Returns a numpy array of floats of the given shape, in memory shared with the worker processes."""
+    return np.frombuffer(multiprocessing.RawArray('d', int(np.prod(shape)))).reshape(shape)
+
+def dense(m):
+    """ Returns m as a dense numpy array."""
+    return m.toarray() if hasattr(m, 'toarray') else np.asarray(m)
+
+def stripWorker(conn, *args):
+    """ Runs a strip (see runStrip) in its own process for StripArray. If it fails,
+        the traceback is sent back as ('error', traceback) instead of an answer,
+        so that StripArray does not wait for it forever."""
+    try:
+        runStrip(conn, *args)
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+        conn.close()
+
+def runStrip(conn, j, k, g0, gs, g1, M, mem, seed):
+    """ Steps one strip of a junction array.
+
+        The strip owns grains g0 to g1: the interior rows g0 to gs and the separator
+        row gs to g1 between it and the next strip (none for the last strip).
+        The worker answers every message from conn once it is done with it:
+            ('s', i): puts the sources of its grains under bias current i into mem['s']
+                      and the part of the separator sources its interior accounts for into mem['g'][k]
+            ('v',): finishes the solve with the separator solution mem['x'] and takes an euler step
+            None: stops
+
+        conn: end of the pipe to StripArray
+        j: the JJs.JJArray
+        k: number of the strip
+        M: damping matrix as a scipy csr matrix or a dense numpy array
+        mem: dictionary of the shared arrays
+        seed: seed of the noise of the strip (None seeds randomly)"""
+    N = j.nodes
+    n = g1 - g0
+    pv, s, g, x, noise = mem['pv'], mem['s'], mem['g'], mem['x'], mem['noise']
+    sep = mem['sep']
+    # edges with an end on the strip, and which end that is
+    E = np.nonzero(((j.ea >= g0) & (j.ea < g1)) | ((j.eb >= g0) & (j.eb < g1)))[0]
+    a, b = j.ea[E], j.eb[E]
+    selA = np.nonzero((a >= g0) & (a < g1))[0]
+    selB = np.nonzero((b >= g0) & (b < g1))[0]
+    locA, locB = a[selA] - g0, b[selB] - g0
+    own = E[selA] # edges whose noise this strip draws
+    iex = j.Iex[g0:g1]
+    # the block of the interior and its coupling to the separators
+    solve = factorize(M[g0:gs][:, g0:gs])
+    C = M[g0:gs][:, sep]
+    D = M[sep][:, g0:gs]
+    if sparse is not None:
+        cols = np.unique(C.tocoo().col)
+    else:
+        cols = np.nonzero(np.any(C != 0, axis=0))[0]
+    schur = np.zeros((len(sep), len(sep)))
+    for c0 in xrange(0, len(cols), 64):
+        cs = cols[c0:c0 + 64]
+        schur[:, cs] = dense(D.dot(solve(dense(C[:, cs]))))
+    conn.send(schur)
+    rng = np.random.RandomState(seed)
+    sig = j.sig
+    dt = j.dt
+    if sig:
+        noise[0, own] = sig*rng.standard_normal(len(own))
+    t = 0
+    sk = None
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        if msg[0] == 's':
+            p, v = pv[:N], pv[N:]
+            ie = v[a] - v[b] + np.sin(p[a] - p[b])
+            if sig:
+                ie += noise[t % 2, E]
+            sk = iex*msg[1] - np.bincount(locA, ie[selA], n) + np.bincount(locB, ie[selB], n)
+            s[g0:g1] = sk
+            g[k] = D.dot(solve(sk[:gs - g0]))
+        else:
+            dv = np.empty(n)
+            dv[:gs - g0] = solve(sk[:gs - g0] - C.dot(x))
+            dv[gs - g0:] = x[k*j.cols:k*j.cols + g1 - gs]
+            pv[g0:g1] += dt*pv[N + g0:N + g1]
+            pv[N + g0:N + g1] += dt*dv
+            t += 1
+            if sig:
+                noise[t % 2, own] = sig*rng.standard_normal(len(own))
+        conn.send(None)
+    conn.close()
+
+class StripArray:
+    """ A JJs.JJArray stepped by worker processes, each of which owns a strip of its rows.
+
+        The phases and voltages of the grains live in shared memory, so the strips
+        read the boundary rows of their neighbours directly. The damping solve is split
+        the same way: one row between every pair of strips separates them, every strip
+        solves its interior with its own factorization and only the small system of the
+        separator rows is solved centrally. This needs a damping matrix that only couples
+        grains in the same or neighbouring rows.
+
+        Every step takes two rounds of messages with the workers, so this pays off for
+        large arrays. Only the euler integrator is supported. The noise of each strip is
+        its own random stream, so noisy runs depend on the number of workers."""
+    def __init__(self, j, workers = 2, seed = None):
+        """ Starts the worker processes.
+
+            j: JJs.JJArray. Its state is copied into shared memory and back after every applyI
+            workers: number of strips (and processes)
+            seed: seed of the noise of the strips (see Parallel.streamSeed), None seeds randomly"""
+        if j.rows < 2*workers - 1:
+            raise Exception('Strips need at least {0} rows for {1} workers'.format(2*workers - 1, workers))
+        self.j = j
+        self.dt = j.dt
+        self.workers = workers
+        self.steps = 0
+        self.timers = None
+        N, c = j.nodes, j.cols
+        M = sparse.csr_matrix(j.B, dtype=float) if sparse is not None else np.array(j.B, dtype=float)
+        # strip k has interior rows r[k] to r[k] + h[k] and then one separator row
+        inner = j.rows - (workers - 1)
+        h = [inner//workers + (1 if k < inner % workers else 0) for k in xrange(workers)]
+        r = np.cumsum([0] + [hk + 1 for hk in h])
+        bounds = [(r[k]*c, (r[k] + h[k])*c, min(r[k + 1]*c, N)) for k in xrange(workers)]
+        sep = np.concatenate([np.arange(gs, g1) for g0, gs, g1 in bounds]).astype(int)
+        label = np.empty(N, dtype=int)
+        label.fill(-1)
+        for k, (g0, gs, g1) in enumerate(bounds):
+            label[g0:gs] = k
+        ii, jj = (M.nonzero() if sparse is not None else np.nonzero(M))
+        if np.any((label[ii] >= 0) & (label[jj] >= 0) & (label[ii] != label[jj])):
+            raise Exception('Strips need a damping matrix that only couples neighbouring rows')
+        self.sep = sep
+        self.mem = {'pv': shared(2*N), 's': shared(N), 'g': shared(workers, len(sep)),
+                    'x': shared(len(sep)), 'noise': shared(2, len(j.ea)), 'sep': sep}
+        self.mem['pv'][:] = j.pv
+        self.conns = []
+        self.procs = []
+        for k, (g0, gs, g1) in enumerate(bounds):
+            here, there = multiprocessing.Pipe()
+            ps = Parallel.streamSeed(seed, k) if seed is not None else None
+            proc = multiprocessing.Process(target = stripWorker, args = (there, j, k, g0, gs, g1, M, self.mem, ps))
+            proc.daemon = True
+            proc.start()
+            there.close() # so that recv fails instead of waiting if the worker dies
+            self.conns.append(here)
+            self.procs.append(proc)
+        S = dense(M[sep][:, sep]) - sum(self.recv(conn) for conn in self.conns)
+        self.solveSep = factorize(S)
+
+    def getInfo(self):
+        """ Returns info about the junction array."""
+        return self.j.getInfo()
+
+    def getType(self):
+        """ Returns type of the junction array."""
+        return self.j.getType()
+
+    def getTemp(self):
+        """ Returns normalized temperature at which the junction array is operating."""
+        return self.j.getTemp()
+
+    def send(self, conn, msg):
+        """ Sends msg to a worker. If the worker died, all the workers are stopped
+            and the error is raised."""
+        try:
+            conn.send(msg)
+        except (IOError, OSError):
+            self.terminate()
+            raise Exception('A strip worker died')
+
+    def recv(self, conn):
+        """ Returns the answer of a worker. If the worker failed or died, all the workers
+            are stopped and the error is raised."""
+        try:
+            msg = conn.recv()
+        except (EOFError, IOError, OSError):
+            self.terminate()
+            raise Exception('A strip worker died')
+        if isinstance(msg, tuple) and msg[0] == 'error':
+            self.terminate()
+            raise Exception('A strip worker failed:\n' + msg[1])
+        return msg
+
+    def step(self, i):
+        """ Takes one euler step of the whole array under bias current i."""
+        for conn in self.conns:
+            self.send(conn, ('s', i))
+        for conn in self.conns:
+            self.recv(conn)
+        mem = self.mem
+        mem['x'][:] = self.solveSep(mem['s'][self.sep] - mem['g'].sum(0))
+        for conn in self.conns:
+            self.send(conn, ('v',))
+        for conn in self.conns:
+            self.recv(conn)
+
+    def applyI(self, i = 0.0, T = 1000, settle = None):
+        """ Applies bias current to the junction array for duration T, like JJs.JJArray.applyI.
+
+            sets the phase of the array to the most recent phase
+            returns the average voltage between the first and last node."""
+        j = self.j
+        j.i = i
+        N = j.nodes
+        pv = self.mem['pv']
+        start = time.time()
+        iT = int(T/self.dt) # renormalized time to integer values
+        t0 = 3*iT/5 + 1 # steps before the averaging starts
+        n = iT - t0
+        if settle is not None:
+            t0 = int(settle*iT)
+        sumv = 0.0
+        for t in xrange(t0 + n):
+            self.step(i)
+            if t >= t0:
+                sumv += pv[N] - pv[2*N - 1] # get voltage between first node and last node
+        np.fmod(pv[:N], 2*math.pi, out=pv[:N])
+        j.pv = pv.copy()
+        self.steps = t0 + n
+        if self.timers is not None:
+            self.timers.add('integrator', time.time() - start)
+        return float(sumv/n)
+
+    def close(self):
+        """ Stops the worker processes."""
+        for conn in self.conns:
+            conn.send(None)
+        for proc in self.procs:
+            proc.join()
+        self.conns = []
+        self.procs = []
+
+    def terminate(self):
+        """ Kills the worker processes, e.g. after one of them failed."""
+        for proc in self.procs:
+            proc.terminate()
+            proc.join()
+        for conn in self.conns:
+            conn.close()
+        self.conns = []
+        self.procs = []
\ No newline at end of file
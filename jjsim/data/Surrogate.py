@@ -0,0 +1,176 @@
+import os, bisect
+import numpy as np
+from jjsim import JJs
+import IVPlot
+import Parallel
+
+def ivLoop(args):
+    """ Runs the hysteresis loop of a simple junction over the currents cs, raised and then lowered.
+        Returns b, cs and the lists of the average voltages of the raising and the lowering branch,
+        both in the order of cs.
+
+        args: tuple of b, cs, T and dt"""
+    b, cs, T, dt = args
+    j = JJs.JJ(b_c = b, dt = dt)
+    up = [j.applyI(i, T) for i in cs]
+    down = [j.applyI(i, T) for i in reversed(cs)][::-1]
+    return b, cs, up, down
+
+def curvature(xs, fs, k):
+    """ Returns the second divided difference of the points (xs, fs) at point k, 0 at the ends."""
+    if k <= 0 or k >= len(xs) - 1:
+        return 0.0
+    d1 = (fs[k] - fs[k - 1])/(xs[k] - xs[k - 1])
+    d2 = (fs[k + 1] - fs[k])/(xs[k + 1] - xs[k])
+    return 2*(d2 - d1)/(xs[k + 1] - xs[k - 1])
+
+def cellErrors(xs, fs):
+    """ Returns the estimated error of linear interpolation in every interval of the points (xs, fs),
+        h^2/8 times the largest curvature at its ends. A jump inside an interval gives an error of the
+        order of the jump."""
+    cs = [abs(curvature(xs, fs, k)) for k in xrange(len(xs))]
+    return [(xs[k + 1] - xs[k])**2/8*max(cs[k], cs[k + 1]) for k in xrange(len(xs) - 1)]
+
+class IVTable:
+    """ A table of the IV characteristics of simple junctions, raising and lowering the current,
+        over a grid of b and bias current.
+
+        Queries are answered by interpolating linearly in the current and in b, along with
+        an estimate of the interpolation error from the curvature of the table. A query
+        whose error estimate is above tol, or that falls outside the table, is simulated
+        instead: the loop of its b is run over the table currents together with its current,
+        and added to the table as a new row.
+
+        Every row holds its own list of currents. The table is stored in a compressed
+        .npz file, with the voltages as float32."""
+    def __init__(self, path = None, tol = .01, T = 1000, dt = .01, di = .01, imax = 1.5):
+        """ Initiates the table, loading it from path if the file exists.
+
+            path: .npz file of the table (None keeps it in memory only)
+            tol: largest estimated error of an interpolated voltage
+            T: duration of junction averaging of the simulated points
+            dt: timestep of the simulated junctions
+            di: current step of new rows
+            imax: max current of new rows """
+        self.path = path
+        self.tol = tol
+        self.T = T
+        self.dt = dt
+        self.di = di
+        self.imax = imax
+        self.bs = []
+        self.cs = []
+        self.vs = {'up': [], 'down': []}
+        self.errs = {'up': [], 'down': []}
+        self.simulated = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        """ Reads the table from self.path."""
+        f = np.load(self.path)
+        self.T, self.dt, self.di, self.imax = f['meta'].tolist()
+        ends = np.cumsum(f['lens']).tolist()
+        for b, n0, n1 in zip(f['b'].tolist(), [0] + ends[:-1], ends):
+            self.insert(b, f['i'][n0:n1].tolist(), f['up'][n0:n1].tolist(), f['down'][n0:n1].tolist())
+
+    def save(self):
+        """ Writes the table to self.path."""
+        tmp = self.path + '.tmp.npz'
+        np.savez_compressed(tmp, meta = np.array([self.T, self.dt, self.di, self.imax]),
+                            b = np.array(self.bs), lens = np.array([len(cs) for cs in self.cs]),
+                            i = np.array(sum(self.cs, [])),
+                            up = np.array(sum(self.vs['up'], []), dtype = np.float32),
+                            down = np.array(sum(self.vs['down'], []), dtype = np.float32))
+        os.rename(tmp, self.path)
+
+    def insert(self, b, cs, up, down):
+        """ Adds the row of b, replacing the row already there for b."""
+        b = float(b)
+        k = bisect.bisect_left(self.bs, b)
+        new = k == len(self.bs) or self.bs[k] != b
+        for name, vs in (('up', up), ('down', down)):
+            if new:
+                self.vs[name].insert(k, None)
+                self.errs[name].insert(k, None)
+            self.vs[name][k] = list(vs)
+            self.errs[name][k] = cellErrors(cs, vs)
+        if new:
+            self.bs.insert(k, b)
+            self.cs.insert(k, None)
+        self.cs[k] = list(cs)
+
+    def rowCurrents(self, i = None, old = ()):
+        """ Returns the currents of a new row, from 0 up to imax in steps of di, stretched to include i.
+            The currents old of the row it replaces are kept, except those within di/10 of i."""
+        if i is None:
+            return IVPlot.currents(0.0, self.imax + self.di/2, self.di)
+        cs = IVPlot.currents(min(0.0, i), max(self.imax, i) + self.di/2, self.di) + list(old)
+        return sorted(set([c for c in cs if abs(c - i) > self.di/10] + [i]))
+
+    def build(self, bs, workers = 1):
+        """ Simulates and adds the rows of every b in bs.
+
+            workers: number of processes the rows are spread over"""
+        res = Parallel.runTasks(ivLoop, [(b, self.rowCurrents(), self.T, self.dt) for b in bs], workers)
+        for r in res:
+            self.insert(*r)
+        self.simulated += len(res)
+        if self.path is not None:
+            self.save()
+
+    def row(self, k, i, branch):
+        """ Returns the interpolated voltage of row k at current i and its estimated error,
+            or None if i is outside of the row."""
+        cs = self.cs[k]
+        if not cs[0] <= i <= cs[-1]:
+            return None
+        n = bisect.bisect_right(cs, i) - 1
+        if n == len(cs) - 1:
+            n -= 1
+        vs = self.vs[branch][k]
+        if cs[n] == i:
+            return vs[n], 0.0 # a simulated point
+        return vs[n] + (i - cs[n])/(cs[n + 1] - cs[n])*(vs[n + 1] - vs[n]), self.errs[branch][k][n]
+
+    def estimate(self, b, i, branch = 'up'):
+        """ Returns the interpolated voltage at b and current i on the branch ('up' or 'down')
+            and its estimated error, or None if the point is outside of the table."""
+        bs = self.bs
+        k = bisect.bisect_right(bs, b) - 1
+        if k < 0:
+            return None
+        if bs[k] == b:
+            return self.row(k, i, branch)
+        if k == len(bs) - 1:
+            return None
+        lo, hi = self.row(k, i, branch), self.row(k + 1, i, branch)
+        if lo is None or hi is None:
+            return None
+        # the error of interpolating in b, from the curvature over the neighbouring rows
+        ks = range(max(k - 1, 0), min(k + 3, len(bs)))
+        fs = [self.row(m, i, branch) for m in ks]
+        if None not in fs:
+            xs = [bs[m] for m in ks]
+            fs = [f[0] for f in fs]
+            c = max(abs(curvature(xs, fs, n)) for n in xrange(len(xs)))
+        else:
+            c = 0.0
+        w = (b - bs[k])/(bs[k + 1] - bs[k])
+        err = max(lo[1], hi[1], (bs[k + 1] - bs[k])**2/8*c)
+        return lo[0] + w*(hi[0] - lo[0]), err
+
+    def v(self, b, i, branch = 'up'):
+        """ Returns the average voltage of a simple junction with b_c = b at bias current i,
+            on the branch raising ('up') or lowering ('down') the current.
+            It is simulated and added to the table when it can not be interpolated to within tol."""
+        est = self.estimate(b, i, branch)
+        if est is not None and est[1] <= self.tol:
+            return est[0]
+        k = bisect.bisect_left(self.bs, b)
+        old = self.cs[k] if k < len(self.bs) and self.bs[k] == b else ()
+        self.insert(*ivLoop((b, self.rowCurrents(i, old), self.T, self.dt)))
+        self.simulated += 1
+        if self.path is not None:
+            self.save()
+        return self.row(bisect.bisect_left(self.bs, b), i, branch)[0]
\ No newline at end of file
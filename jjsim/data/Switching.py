@@ -0,0 +1,133 @@
+import math
+import numpy as np
+import Output
+import Progress
+import time, datetime
+
+def ramp(j, trials, rate, vth = .5, i0 = 0.0, imax = 1.5, window = None, seed = None, track = None, dmark = .01):
+    """ Ramps the bias current of many copies of a junction and detects when each of them switches.
+        Returns an array with the switching current of every trial (nan if it did not switch before imax).
+
+        Every trial starts from the state of j. They are stepped together as numpy arrays,
+        like a JJs.JJEnsemble, and a trial is dropped from the arrays as soon as it switches,
+        so the later part of the ramp only steps the trials that are still trapped.
+
+        j: simple or noisy junction
+        trials: number of copies of j
+        rate: ramp rate di/dt of the bias current
+        vth: a trial has switched once its voltage averaged over a window exceeds vth
+        i0, imax: currents at the start and end of the ramp
+        window: number of timesteps the voltage is averaged over (None is one plasma period, 2*pi)
+        seed: seed for the noise of the trials (None seeds randomly)
+        track: Progress.Tracker that gets a point every time the current has risen by dmark, or None
+        dmark: current step between the points reported to track"""
+    if j.getType() not in ('simple', 'noisy'):
+        raise Exception('Switching currents need a simple or noisy junction')
+    dt = float(j.dt)
+    window = window or max(int(2*math.pi/dt), 1)
+    rng = np.random.RandomState(seed)
+    p = np.empty(trials)
+    p.fill(j.phase)
+    v = np.empty(trials)
+    v.fill(j.volt)
+    idx = np.arange(trials)
+    isw = np.empty(trials)
+    isw.fill(np.nan)
+    rb = dt/j.b
+    sb = getattr(j, 'sig', 0.0)*rb
+    di = rate*dt # current step of a timestep
+    n = int(math.ceil((imax - i0)/di))
+    mark = i0 + dmark
+    steps = 0
+    t = 0
+    while t < n and len(p):
+        m = min(window, n - t)
+        a = np.empty(len(p))
+        pw = p.copy()
+        for s in xrange(m):
+            # a = dt*dv, computed before p is moved so the step is the same as euler
+            np.sin(p, out=a)
+            a += v
+            a *= -rb
+            a += (i0 + di*(t + s))*rb
+            if sb:
+                a += sb*rng.standard_normal(len(p))
+            p += dt*v
+            v += a
+        t += m
+        steps += m*len(p)
+        sw = p - pw > vth*m*dt
+        if sw.any():
+            isw[idx[sw]] = i0 + di*t
+            keep = ~sw
+            p, v, idx = p[keep], v[keep], idx[keep]
+        while track is not None and mark <= i0 + di*t:
+            track.point(mark, steps)
+            mark += dmark
+            steps = 0
+    return isw
+
+def histogram(isw, i0, imax, di):
+    """ Returns the left edges of bins of width di from i0 to imax and the number of
+        switching currents in isw that fall into each of them."""
+    edges = np.arange(i0, imax, di)
+    counts = np.histogram(isw[~np.isnan(isw)], np.append(edges, edges[-1] + di))[0]
+    return edges, counts
+
+def escapeRates(counts, di, rate, trapped = 0):
+    """ Returns the escape rate out of the zero voltage state at every bin of a
+        switching current histogram (Fulton and Dunkleberger), nan where it is unknown.
+
+        counts: number of switches in each bin
+        di: width of the bins
+        rate: ramp rate di/dt the histogram was measured with
+        trapped: number of trials that never switched, which are still trapped past the last bin"""
+    left = np.cumsum(counts[::-1])[::-1].astype(float) + trapped # trials still trapped at each bin
+    after = np.append(left[1:], trapped) # trials still trapped after each bin
+    rates = np.empty(len(counts))
+    rates.fill(np.nan)
+    k = np.nonzero(after > 0)[0]
+    rates[k] = rate/di*np.log(left[k]/after[k])
+    return rates
+
+def switchDist(j, trials = 10000, rate = 1e-4, di = .005, vth = .5, i0 = 0.0, imax = 1.5, fl='test.dat', window=None, seed=None, fmt='dat', progress=None):
+    """ Produces data file with the switching current distribution of a junction and its escape rates.
+
+        j: simple or noisy junction
+        trials: number of times the current is ramped
+        rate: ramp rate di/dt of the bias current
+        di: width of the bins of the histogram
+        vth: voltage at which a junction counts as switched
+        i0: initial current
+        imax: max current
+        fl: data file to write
+        window: number of timesteps the voltage is averaged over to detect a switch (see ramp)
+        seed: seed for the noise of the trials
+        fmt: 'dat' for a text file or 'npy' for binary columns (see Output)
+        progress: callback receiving the progress reports, one point per bin (see Progress.Tracker)"""
+    start_time = time.time()
+    edges = np.arange(i0, imax, di)
+    track = Progress.Tracker([j], len(edges), progress)
+    track.report('start')
+    isw = ramp(j, trials, rate, vth, i0, imax, window, seed, track, di)
+    edges, counts = histogram(isw, i0, imax, di)
+    sw = isw[~np.isnan(isw)]
+    rates = escapeRates(counts, di, rate, len(isw) - len(sw))
+
+    nw = datetime.datetime.now()
+    head = ['Switching Current Distribution \n',
+            'Type of Junction:   {0} \n'.format(j.getType()),
+            'Junction Info:      {0} \n'.format(j.getInfo()),
+            'dt, rate:           {0}, {1} \n'.format(j.dt, rate),
+            'current range, di:  {1}-{2}, {0} \n'.format(di, i0, imax),
+            'trials, switched:   {0}, {1} \n'.format(trials, len(sw)),
+            'mean, std:          {0}, {1} \n'.format(sw.mean() if len(sw) else float('nan'), sw.std() if len(sw) else float('nan')),
+            'Date:               {0}/{1}/{2} \n'.format(nw.month, nw.day, nw.year),
+            'Time:               {0}:{1} \n'.format(nw.hour, nw.minute)]
+    colhead = 'Current    Switches    Density       Escape rate \n(i)        (n)         (P)           (G) \n'
+    rowfmt = '{0:.5f}    {1:<8.0f}    {2:.8f}    {3:.8e} \n'
+    w = Output.writer(fl, head, colhead, rowfmt, ['i', 'n', 'P', 'G'], fmt)
+    for k in xrange(len(edges)):
+        w.row([edges[k] + di/2, int(counts[k]), counts[k]/(len(sw)*di) if len(sw) else 0.0, rates[k]])
+    fl = w.close(time.time() - start_time)
+    track.done(fl, 'done {0}'.format(fl))
\ No newline at end of file
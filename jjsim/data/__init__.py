@@ -1 +1 @@
-__all__ = ["FileSetup", "IVPlot", "Phase"]
\ No newline at end of file
+__all__ = ["FileSetup", "IVPlot", "Phase", "Parallel", "Cache", "Output", "Progress", "Switching", "Strips", "Surrogate", "Checkpoint", "Spectrum", "Damping", "Scan"]
\ No newline at end of file
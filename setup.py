@@ -1,2 +1,2 @@
 from setuptools import setup
-setup(name='jjsim', version='0.1')
\ No newline at end of file
+setup(name='jjsim', version='0.1', install_requires=['numpy'], extras_require={'sparse': ['scipy']})
\ No newline at end of file